@@ -0,0 +1,352 @@
+import hashlib
+import json
+import os
+import traceback
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+from metrics import critical_path, load_metrics
+from sdk import public_url, write_atomic
+from yaml_cache import load_yaml
+
+ACTIVITY_FILE = "activity.json"
+DELTA_FILE = "activity.delta.json"
+# the same activity split into shards listed by a small manifest, so the
+# dashboard only loads what it shows: one shard per state, and complete
+# projects further split by month
+SHARD_FOLDER = "activity"
+MANIFEST_FILE = "manifest.json"
+STATE_ORDER = ["invite", "running", "complete"]
+# last published version and per-project hashes, to detect changes and
+# build deltas without reading back what we published
+PUBLISH_STATE_FILE = "./activity_state.json"
+
+
+def discover_projects(index) -> Dict[Tuple[str, str], Dict[str, List]]:
+    """Collect every project YAML, join marker and metrics file in a single
+    pass over the index, grouped by (author, project) before anything is
+    parsed."""
+    groups = {}
+    for entry in index.entries:
+        kind = entry["kind"]
+        if kind not in ("yaml", "join", "metrics"):
+            continue
+
+        path = index.root / entry["path"]
+        # join markers are named after the project YAML, not its folder
+        project = path.name.split(".yaml")[0]
+        group = groups.setdefault(
+            (entry["author"], project), {"yamls": [], "joins": [], "metrics": []}
+        )
+        if kind == "yaml":
+            group["yamls"].append((entry["datasite"], path))
+        elif kind == "join":
+            group["joins"].append(entry["datasite"])
+        else:
+            group["metrics"].append(path)
+    return groups
+
+
+def parse_yaml_project(
+    datasite, yaml_path: str, joined_datasites: List[str]
+) -> Dict[str, Any]:
+    """Parse a project YAML file and return structured data with nested code entries."""
+    yaml_data = load_yaml(yaml_path)
+
+    timestamp = os.stat(yaml_path)
+
+    if datasite != yaml_data["author"]:
+        print("Not the author of the datasite, so skipping", yaml_path)
+        return
+
+    # Determine the project state from the file path
+    state = "invite"
+    if "invite" in str(yaml_path):
+        state = "invite"
+    elif "running" in str(yaml_path):
+        state = "running"
+    elif "complete" in str(yaml_path):
+        state = "complete"
+    else:
+        print("Unknown state", yaml_path)
+
+    # Extract datasites from the workflow section
+    datasites = yaml_data.get("workflow", {}).get("datasites", [])
+    if isinstance(datasites, dict) and "*datasites" in datasites:
+        datasites = datasites.get("*datasites", [])
+
+    datasites = sorted(set(list(datasites) + list(joined_datasites)))
+    print("yaml_path", yaml_path, "datasites", datasites)
+
+    # Construct base URLs using author and project
+    url = public_url(os.path.dirname(yaml_path))
+    base_url = "/datasites" + url.split("/datasites")[-1]
+
+    # Generate a nested dictionary under `code` for each file in the YAML's `code` list
+    code_files = yaml_data.get("code", [])
+    code_data = {file: f"{base_url}/{file}" for file in code_files}
+
+    # Construct the project data with nested `code` dictionary and joined datasites
+    project_data = {
+        "state": state,
+        "name": yaml_data["project"],
+        "file_timestamp": timestamp.st_mtime,
+        "description": yaml_data["description"],
+        "language": yaml_data["language"],
+        "author": yaml_data["author"],
+        "sourceUrl": base_url,
+        "sharedInputs": yaml_data.get("shared_inputs", {}).get("data", ""),
+        "datasites": datasites,
+        "resultUrl": f"{base_url}/results",
+        "code": code_data,  # Nested dictionary for code entries
+    }
+
+    return project_data
+
+
+def generate_activity_json(index):
+    """Generate activity.json from YAML project files."""
+    # Initialize project categories
+    activity_data = {"invite": [], "running": [], "complete": []}
+
+    for (author, project), group in sorted(discover_projects(index).items()):
+        for datasite, yaml_path in group["yamls"]:
+            try:
+                project_data = parse_yaml_project(datasite, yaml_path, group["joins"])
+                if project_data is None:
+                    continue
+
+                # where the time went, across every participant's steps
+                if project_data["state"] != "invite" and group["metrics"]:
+                    # peers write these files, a bad one only loses this field
+                    try:
+                        path = critical_path(load_metrics(group["metrics"]))
+                    except Exception as e:
+                        print(f"Error reading metrics of {yaml_path}: {str(e)}")
+                        path = None
+                    if path is not None:
+                        project_data["criticalPath"] = path
+
+                if project_data["state"] in activity_data:
+                    activity_data[project_data["state"]].append(project_data)
+
+            except Exception as e:
+                print(traceback.format_exc())
+                print(f"Error processing {yaml_path}: {str(e)}")
+                continue
+    return activity_data
+
+
+def encode(data) -> bytes:
+    """Compact, canonical JSON so equal content always hashes the same."""
+    return json.dumps(data, separators=(",", ":"), sort_keys=True).encode()
+
+
+def content_hash(data) -> str:
+    return hashlib.sha256(encode(data)).hexdigest()
+
+
+def project_key(project) -> str:
+    return f"{project['state']}/{project['author']}/{project['name']}"
+
+
+def load_publish_state(state_file) -> Dict[str, Any]:
+    try:
+        with open(state_file, "r") as file:
+            return json.load(file)
+    except (OSError, json.JSONDecodeError):
+        return {"version": 0, "hash": None, "projects": {}}
+
+
+def publish_activity(activity, folders, state_file=PUBLISH_STATE_FILE) -> bool:
+    """Writes activity.json and activity.delta.json to each folder, only when
+    the activity changed since the last version.
+
+    Both carry `version` and `hash`. The delta holds the projects added or
+    changed since `from_version` under `upserts` and the keys of removed ones
+    under `removed`, so readers on the previous version don't need the full
+    document. The shards and their manifest are updated along with them, see
+    `publish_shards`. Returns True if anything was written.
+    """
+    state = load_publish_state(state_file)
+    new_hash = content_hash(activity)
+    missing = [
+        folder
+        for folder in folders
+        if not os.path.exists(f"{folder}/{ACTIVITY_FILE}")
+        or not os.path.exists(f"{folder}/{SHARD_FOLDER}/{MANIFEST_FILE}")
+    ]
+    if new_hash == state["hash"] and not missing:
+        return False
+
+    projects = {
+        project_key(project): project
+        for projects in activity.values()
+        for project in projects
+    }
+    project_hashes = {key: content_hash(project) for key, project in projects.items()}
+
+    version = state["version"]
+    if new_hash != state["hash"]:
+        version += 1
+    document = {"version": version, "hash": new_hash, **activity}
+    delta = {
+        "version": version,
+        "hash": new_hash,
+        "from_version": state["version"],
+        "upserts": [
+            projects[key]
+            for key, project_hash in project_hashes.items()
+            if state["projects"].get(key) != project_hash
+        ],
+        "removed": sorted(set(state["projects"]) - set(project_hashes)),
+    }
+
+    for folder in folders:
+        os.makedirs(folder, exist_ok=True)
+        # the delta goes first, so a reader who sees the new document can
+        # also find the delta leading to it
+        write_atomic(f"{folder}/{DELTA_FILE}", encode(delta))
+        write_atomic(f"{folder}/{ACTIVITY_FILE}", encode(document))
+
+    shard_state = publish_shards(activity, folders, version, new_hash, state)
+    state = {
+        "version": version,
+        "hash": new_hash,
+        "projects": project_hashes,
+        **shard_state,
+    }
+    write_atomic(state_file, encode(state))
+    return True
+
+
+def time_bucket(timestamp) -> str:
+    return datetime.utcfromtimestamp(timestamp or 0).strftime("%Y-%m")
+
+
+def shard_activity(activity) -> Dict[str, Dict[str, Any]]:
+    """Splits the activity by state, and complete projects by month."""
+    shards = {}
+    for state in STATE_ORDER:
+        for project in activity.get(state, []):
+            bucket = None
+            name = f"{state}.json"
+            if state == "complete":
+                bucket = time_bucket(project.get("file_timestamp"))
+                name = f"{state}-{bucket}.json"
+            shard = shards.setdefault(
+                name, {"name": name, "state": state, "bucket": bucket, "projects": []}
+            )
+            shard["projects"].append(project)
+    return shards
+
+
+def delta_name(shard_name) -> str:
+    """`running.json` -> `running.delta.json`"""
+    return f"{shard_name[: -len('.json')]}.delta.json"
+
+
+def shard_delta(shard, previous_members, project_hashes, previous_hashes):
+    """The projects of a shard added or changed since its previous version
+    under `upserts`, and the keys of those that left it under `removed`."""
+    members = [project_key(project) for project in shard["projects"]]
+    return {
+        "upserts": [
+            project
+            for key, project in zip(members, shard["projects"])
+            if key not in previous_members
+            or previous_hashes.get(key) != project_hashes[key]
+        ],
+        "removed": sorted(set(previous_members) - set(members)),
+    }
+
+
+def publish_shards(activity, folders, version, activity_hash, previous):
+    """Writes the shards that changed and a manifest listing every shard with
+    its state, month, project count, newest timestamp and hash.
+
+    Readers compare shard hashes with the ones they hold and fetch only the
+    shards they show that changed. A changed shard also gets a
+    `<shard>.delta.json` from its previous version, listed in the manifest
+    under `delta` with the hash it applies to, so a reader holding that
+    version fetches the changed projects instead of the whole shard.
+
+    `previous` is the publish state of the last version. Returns the shard
+    hashes, members and deltas to keep in it.
+    """
+    shards = shard_activity(activity)
+    hashes = {name: content_hash(shard) for name, shard in shards.items()}
+    members = {
+        name: [project_key(project) for project in shard["projects"]]
+        for name, shard in shards.items()
+    }
+    project_hashes = {
+        project_key(project): content_hash(project)
+        for shard in shards.values()
+        for project in shard["projects"]
+    }
+    previous_hashes = previous.get("shards", {})
+    previous_members = previous.get("shard_members", {})
+    # the hash each shard's delta file applies to, kept while it is current
+    deltas = {
+        name: from_hash
+        for name, from_hash in previous.get("deltas", {}).items()
+        if name in shards and hashes[name] == previous_hashes.get(name)
+    }
+    delta_files = {}
+    for name, shard in shards.items():
+        if hashes[name] == previous_hashes.get(name) or name not in previous_members:
+            continue
+        delta_files[name] = {
+            "name": name,
+            "from_hash": previous_hashes[name],
+            "hash": hashes[name],
+            **shard_delta(
+                shard,
+                previous_members[name],
+                project_hashes,
+                previous.get("projects", {}),
+            ),
+        }
+        deltas[name] = previous_hashes[name]
+
+    # by state, newest months first
+    ordered = sorted(
+        shards.items(), key=lambda item: item[1]["bucket"] or "", reverse=True
+    )
+    ordered.sort(key=lambda item: STATE_ORDER.index(item[1]["state"]))
+    entries = []
+    for name, shard in ordered:
+        entry = {
+            "name": name,
+            "state": shard["state"],
+            "bucket": shard["bucket"],
+            "count": len(shard["projects"]),
+            "newest": max(
+                project.get("file_timestamp") or 0 for project in shard["projects"]
+            ),
+            "hash": hashes[name],
+        }
+        if name in deltas:
+            entry["delta"] = {"name": delta_name(name), "from": deltas[name]}
+        entries.append(entry)
+    manifest = {"version": version, "hash": activity_hash, "shards": entries}
+
+    for folder in folders:
+        shard_folder = f"{folder}/{SHARD_FOLDER}"
+        os.makedirs(shard_folder, exist_ok=True)
+        for name, shard in shards.items():
+            if name in delta_files:
+                path = f"{shard_folder}/{delta_name(name)}"
+                write_atomic(path, encode(delta_files[name]))
+            path = f"{shard_folder}/{name}"
+            if hashes[name] != previous_hashes.get(name) or not os.path.exists(path):
+                write_atomic(path, encode({**shard, "hash": hashes[name]}))
+        # shards go first so the manifest never lists one that isn't there
+        write_atomic(f"{shard_folder}/{MANIFEST_FILE}", encode(manifest))
+        current = set(shards) | {delta_name(name) for name in deltas}
+        for file_name in os.listdir(shard_folder):
+            if file_name.endswith(".json") and file_name != MANIFEST_FILE:
+                if file_name not in current:
+                    os.unlink(f"{shard_folder}/{file_name}")
+    return {"shards": hashes, "shard_members": members, "deltas": deltas}
@@ -0,0 +1,327 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import List
+from run import run_steps_for_email, check_done, watched_paths
+
+from syftbox.lib import Client, SyftPermission
+
+from sdk import Settings, ensure, get_verified_payloads, public_url
+from index import load_index
+from lifecycle import LINK, MOVE, finish_transition, transition
+from activity import (
+    ACTIVITY_FILE,
+    DELTA_FILE,
+    SHARD_FOLDER,
+    generate_activity_json,
+    publish_activity,
+)
+from yaml_cache import get_yaml_cache, load_yaml
+from logs import flush_logs, log_files
+from metrics import metrics_files
+from permissions import get_permission_manager
+from state import ProjectState
+from tick import save_tick, take_snapshot
+
+client = Client.load()
+
+
+__name__ = "fedreduce"
+__version__ = "1.0.0"
+__author__ = "madhava@openmined.org"
+
+
+def create_folders():
+    private_fedreduce_folder = client.sync_folder / client.email / __name__
+    os.makedirs(private_fedreduce_folder, exist_ok=True)
+
+    public_fedreduce_folder = client.sync_folder / client.email / "public" / __name__
+    public_invite_fedreduce_folder = public_fedreduce_folder / "invite"
+    public_join_fedreduce_folder = public_fedreduce_folder / "join"
+    public_running_fedreduce_folder = public_fedreduce_folder / "running"
+
+    os.makedirs(public_fedreduce_folder, exist_ok=True)
+    os.makedirs(public_invite_fedreduce_folder, exist_ok=True)
+    os.makedirs(public_join_fedreduce_folder, exist_ok=True)
+    os.makedirs(public_running_fedreduce_folder, exist_ok=True)
+
+    permission = SyftPermission.mine_with_public_read(client.email)
+    get_permission_manager().grant(public_fedreduce_folder, permission)
+
+
+# settings
+settings = Settings()
+
+# collected while running projects: files the next tick should watch and
+# projects with failed steps that still have retries left
+watched = set()
+retrying = set()
+
+
+DATASITES = Path(client.sync_folder)
+MY_DATASITE = DATASITES / client.email
+PUBLIC_PATH = MY_DATASITE / "public"
+PUBLISH_PATH = PUBLIC_PATH / __name__
+HOME_URL = f"{public_url(PUBLISH_PATH)}/index.html"
+
+
+def generate_home():
+    """Main function to generate the home page and activity.json."""
+    run_analysis = settings.get("run_analysis", None)
+    if (run_analysis is None and client.email != __author__) or run_analysis is False:
+        return
+
+    # Find all project YAMLs and join markers in one pass over the index
+    activity = generate_activity_json(index)
+
+    # only rewritten when something changed, each rewrite is synced out
+    if publish_activity(activity, [PUBLISH_PATH, "./widget"]):
+        print(f"Writing json to {PUBLISH_PATH / 'activity.json'}")
+
+    print(f"Dashboard published to {HOME_URL}")
+
+    # Ensure web files are in place, the activity files are published above
+    ensure(
+        ["./widget"],
+        PUBLISH_PATH,
+        exclude=[ACTIVITY_FILE, DELTA_FILE, SHARD_FOLDER, ".*"],
+    )
+
+
+def complete_operations(project, is_author) -> List[List[str]]:
+    """The renames that take a finished project to complete."""
+    operations = []
+    if is_author:
+        # move public src author only
+        redreduce_folder = client.sync_folder / client.email / "public" / __name__
+        operations.append(
+            [
+                MOVE,
+                str(redreduce_folder / "running" / project["api_name"]),
+                str(redreduce_folder / "complete" / project["api_name"]),
+            ]
+        )
+
+    # the private source
+    project_path = str(project["project_path"])
+    complete_path = project_path.replace("/running/", "/complete/")
+    operations.append([MOVE, project_path, complete_path])
+
+    # the public logs and metrics, then the join file, whose place decides
+    # the state the next tick sees
+    join_path = str(project["yaml_join_path"])
+    log_file = join_path.replace(".join", ".log")
+    # segments still being written would be left behind
+    flush_logs(release=log_file)
+    for path in log_files(log_file) + metrics_files(log_file) + [join_path]:
+        path = str(path)
+        operations.append([MOVE, path, path.replace("/running/", "/complete/")])
+    return operations
+
+
+def run_project(project, timeout) -> bool:
+    """Runs the steps of one running project and moves it to complete when done.
+
+    `timeout` bounds the whole project, the reduce only gets what its own
+    steps left of it."""
+    deadline = time.time() + timeout
+    project_path = Path(project["project_path"])
+    public_running = Path(project["yaml_join_path"])
+    log_path = str(public_running).replace(".join", ".log")
+    pipeline = load_yaml(project_path / project["api_file_name"])
+    try:
+        run_steps_for_email(
+            client,
+            pipeline,
+            log_file=log_path,
+            timeout=timeout,
+            project_path=project_path,
+        )
+    except Exception as e:
+        print(f"Error running project {project_path}: {str(e)}")
+        retrying.add(str(project_path))
+        return False
+
+    complete, is_author = check_done(
+        client,
+        pipeline,
+        project,
+        log_file=log_path,
+        timeout=max(deadline - time.time(), 0),
+    )
+
+    print("complete", complete)
+
+    if not complete:
+        watched.update(watched_paths(client, pipeline, project_path))
+        state = ProjectState.for_project(
+            client.email, pipeline["author"], pipeline["project"]
+        )
+        if state.retry_pending():
+            retrying.add(str(project_path))
+
+    if complete:
+        state = ProjectState.for_project(
+            client.email, project["author"], project["api_name"]
+        )
+        transition(state, "complete", complete_operations(project, is_author))
+        project["project_path"] = Path(
+            str(project_path).replace("/running/", "/complete/")
+        )
+        project["state"] = "complete"
+
+    return complete
+
+
+def run_projects():
+    my_join_projects = index.glob(datasite=client.email, kind="join")
+
+    join_projects = []
+    running_projects = []
+    complete_projects = []
+    for datasite, join_path in my_join_projects:
+        print("join_path", join_path)
+        project = {}
+        project["yaml_join_path"] = join_path
+        if "/join/" in str(join_path):
+            state = "join"
+        elif "/running/" in str(join_path):
+            state = "running"
+        elif "/complete/" in str(join_path):
+            state = "complete"
+        else:
+            state = "unknown"
+        project["state"] = state
+        last = str(join_path).split("public/fedreduce/")[-1]
+        parts = last.split("/")
+        author = None
+        for part in parts:
+            if "@" in part:
+                author = part
+        project["author"] = author
+        api_name = join_path.name.split(".yaml")[0]
+        api_file_name = join_path.name.split(".join")[0]
+        project["api_name"] = api_name
+        project["api_file_name"] = api_file_name
+        if state == "join":
+            project_path = (
+                client.sync_folder / author / "public" / __name__ / "running" / api_name
+            )
+        elif state == "running":
+            project_path = (
+                client.sync_folder / client.email / __name__ / "running" / api_name
+            )
+        else:
+            project_path = (
+                client.sync_folder / client.email / __name__ / "complete" / api_name
+            )
+
+        project["project_path"] = project_path
+
+        if state == "join":
+            join_projects.append(project)
+        elif state == "running":
+            running_projects.append(project)
+        else:
+            complete_projects.append(project)
+
+    print("join_projects", join_projects)
+    print("running_projects", running_projects)
+    print("complete_projects", complete_projects)
+
+    for project in join_projects:
+        if os.path.exists(project["project_path"]):
+            # move to running
+            running_path = Path(
+                str(project["yaml_join_path"]).replace("/join/", "/running/")
+            )
+
+            project_path = Path(project["project_path"])
+            # the author's project, snapshotted into the local datasite
+            copy_destination = Path(
+                str(project_path)
+                .replace(project["author"], client.email)
+                .replace("/public/", "/")
+            )
+
+            state = ProjectState.for_project(
+                client.email, project["author"], project["api_name"]
+            )
+            transition(
+                state,
+                "running",
+                [
+                    [LINK, str(project_path), str(copy_destination)],
+                    [MOVE, str(project["yaml_join_path"]), str(running_path)],
+                ],
+            )
+
+            project["project_path"] = copy_destination
+            project["yaml_join_path"] = running_path
+            running_projects.append(project)
+
+    # finish transitions an earlier tick was stopped in the middle of
+    for project in list(running_projects):
+        state = ProjectState.for_project(
+            client.email, project["author"], project["api_name"]
+        )
+        if finish_transition(state) == "complete":
+            running_projects.remove(project)
+            complete_projects.append(project)
+
+    max_workers = settings.get("max_concurrent_projects", 4)
+    # by default steps don't wait for inputs at all: each tick advances every
+    # project as far as it can and the persisted step state resumes it later.
+    # A positive project_timeout makes steps wait on their inputs with
+    # inotify, see watch.wait_until
+    timeout = settings.get("project_timeout", 0)
+
+    # a project can still block for up to `timeout` waiting on its inputs, so
+    # run them side by side: a tick takes at most `timeout` for every
+    # `max_workers` projects
+    with ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="fedreduce-project"
+    ) as executor:
+        futures = {
+            executor.submit(run_project, project, timeout): project
+            for project in running_projects
+        }
+        for future in as_completed(futures):
+            project = futures[future]
+            try:
+                if future.result():
+                    complete_projects.append(project)
+            except Exception as e:
+                print(f"Error running project {project['project_path']}: {str(e)}")
+
+    print(complete_projects)
+
+
+def main():
+    """A full tick: publish the dashboard, advance running projects and
+    record what the next tick has to watch."""
+    global index
+    create_folders()
+    index = load_index(client)
+    generate_home()
+    run_projects()
+    # everything granted this tick, written only where it changed
+    get_permission_manager().apply()
+    index.save()
+    yaml_cache = get_yaml_cache()
+    yaml_cache.prune()
+    yaml_cache.save()
+    # payloads hashed this tick aren't hashed again by the next one
+    get_verified_payloads().save()
+
+    # our own writes of this tick must not count as changes for the next one
+    flush_logs()
+    save_tick(
+        take_snapshot(
+            client.sync_folder,
+            client.email,
+            watched,
+            force=bool(retrying),
+        )
+    )
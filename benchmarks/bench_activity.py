@@ -0,0 +1,98 @@
+"""Compare the per-project join glob with single-pass discovery when building
+activity.json.
+
+    python benchmarks/bench_activity.py --datasites 200 --projects 2
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from activity import generate_activity_json, parse_yaml_project  # noqa: E402
+from index import ProjectIndex  # noqa: E402
+from synthetic import make_sync_folder  # noqa: E402
+import yaml_cache  # noqa: E402
+
+
+def glob_activity(datasites_root: Path):
+    """The previous approach: one glob for the YAMLs, then one sync-folder-wide
+    glob for join markers per project."""
+    activity = {"invite": [], "running": [], "complete": []}
+    for yaml_path in datasites_root.glob("**/public/fedreduce/**/*.yaml"):
+        datasite = yaml_path.relative_to(datasites_root).parts[0]
+        joins = [
+            join_path.relative_to(datasites_root).parts[0]
+            for join_path in datasites_root.glob(
+                f"**/public/fedreduce/**/{yaml_path.name}.join"
+            )
+        ]
+        project = parse_yaml_project(datasite, yaml_path, joins)
+        if project:
+            activity[project["state"]].append(project)
+    return activity
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--datasites", type=int, default=100)
+    parser.add_argument("--projects", type=int, default=2)
+    parser.add_argument("--joins", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        datasites_root = make_sync_folder(
+            tmp,
+            datasites=args.datasites,
+            projects_per_state=args.projects,
+            joins_per_project=args.joins,
+        )
+        index_file = os.path.join(tmp, "index.json")
+        cache_file = os.path.join(tmp, "yaml_cache.pickle")
+
+        yaml_cache._yaml_cache = yaml_cache.YamlCache(filename=cache_file)
+        glob_time, old = timed(glob_activity, datasites_root)
+
+        def cold():
+            # nothing persisted yet: full scan and every YAML parsed
+            yaml_cache._yaml_cache = yaml_cache.YamlCache(filename=cache_file)
+            index = ProjectIndex(datasites_root, filename=index_file)
+            index.refresh()
+            activity = generate_activity_json(index)
+            index.save()
+            yaml_cache.get_yaml_cache().save()
+            return activity
+
+        def warm():
+            # next tick: index and parsed YAML loaded from disk
+            yaml_cache._yaml_cache = yaml_cache.YamlCache(filename=cache_file)
+            index = ProjectIndex(datasites_root, filename=index_file)
+            index.refresh()
+            return generate_activity_json(index)
+
+        cold_time, new = timed(cold)
+        warm_time, _ = timed(warm)
+
+    projects = sum(len(projects) for projects in new.values())
+    assert projects == sum(len(projects) for projects in old.values())
+    print(f"datasites={args.datasites} projects={projects}")
+    print(f"per-project glob    {glob_time * 1000:10.1f} ms")
+    print(f"single pass (cold)  {cold_time * 1000:10.1f} ms")
+    print(f"single pass (warm)  {warm_time * 1000:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Per-iteration cost of checking whether a datasite's steps can run, with the
+pipeline planned from YAML every time versus a compiled plan.
+
+    python benchmarks/bench_plan.py --datasites 100 --iterations 200
+
+syftbox is replaced by the local stand-in, see stand_in.py.
+"""
+
+import argparse
+import contextlib
+import copy
+import io
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import stand_in  # noqa: E402
+
+# run.py imports syftbox, the steps only use the SimpleNamespace clients below
+stand_in.install("bench@example.org", tempfile.gettempdir())
+
+import run  # noqa: E402
+from registry import FunctionRegistry  # noqa: E402
+from yaml_cache import parse_yaml  # noqa: E402
+
+
+def uncompiled_iteration(client, pipeline, functions):
+    """What every retry did before: plan, copy and merge step configs, parse
+    pipe strings and format templates, then check readiness."""
+    ready = []
+    for step_num, datasite, step_config, context in run.plan_steps(pipeline):
+        if datasite != client.email:
+            continue
+        inputs = run.build_input_pipes(client, step_config, context)
+        run.instantiate_pipe(client, step_config["output"]["path"], context)
+        functions.get(step_config["function"])
+        ready.append(all(pipe.ready() for pipe in inputs.values()))
+    return ready
+
+
+def compiled_iteration(client, pipeline, project_path):
+    plan = run.get_plan(client, pipeline, project_path)
+    return [step.ready() for step in plan.steps_for(client.email)]
+
+
+def per_iteration(fn, iterations, *args):
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn(*args)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn(*args)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--datasites", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--topology", default="ring", choices=sorted(run.TOPOLOGIES))
+    args = parser.parse_args()
+
+    pipeline = copy.deepcopy(parse_yaml(ROOT / "add.yaml"))
+    datasites = [f"user{i}@example.org" for i in range(args.datasites)]
+    pipeline["author"] = datasites[0]
+    pipeline["workflow"]["topology"] = args.topology
+    pipeline["workflow"]["datasites"] = datasites
+    for step in pipeline["steps"]:
+        if "foreach" in step:
+            step["foreach"] = datasites
+            step["output"]["permissions"]["read"] = [datasites]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # the middle datasite, so both approaches have a step to look at
+        client = SimpleNamespace(
+            email=datasites[len(datasites) // 2], sync_folder=Path(tmp)
+        )
+        functions = FunctionRegistry.for_project(ROOT, pipeline)
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            run.get_plan(client, pipeline, ROOT)
+        compile_time = time.perf_counter() - start
+
+        before = per_iteration(
+            uncompiled_iteration, args.iterations, client, pipeline, functions
+        )
+        after = per_iteration(
+            compiled_iteration, args.iterations, client, pipeline, ROOT
+        )
+
+    print(f"datasites={args.datasites} topology={args.topology}")
+    print(f"compile once         {compile_time * 1e3:10.3f} ms")
+    print(f"uncompiled / iter    {before * 1e3:10.3f} ms")
+    print(f"compiled / iter      {after * 1e3:10.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,662 @@
+"""Simulate a project across many datasites in one process.
+
+Every virtual datasite gets its own sync folder under one temp directory and
+a fake sync layer copies files between them after a per-hop delay. The
+datasites go through the real flow: the author writes an invite, everyone
+joins with the `join` command, the author runs `start`, then each datasite
+ticks `run_steps_for_email` and the author `check_done` until the result is
+in.
+
+    python benchmarks/simulate.py --datasites 50 --topology ring tree star \\
+        --format file array --size 100000 --delay 0.2 --jitter 0.1
+
+A single participant with `--datasites 1 --function add` checks that a
+project's binary function also works on a reduce with one input.
+
+Reports the critical-path latency from `start` to the author seeing the
+result, the wait of every hop between datasites and the bytes synced.
+syftbox is replaced by the local stand-in, see stand_in.py.
+"""
+
+import argparse
+import contextlib
+import heapq
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import stand_in  # noqa: E402
+
+APP_NAME = "fedreduce"
+PERMISSION_FILE = "_.syftperm"
+PROJECT = "simulated"
+
+PROJECT_YAML = """author: "{author}"
+project: "{project}"
+language: "python"
+description: "Simulated {topology} over {datasites} datasites"
+code:
+  - functions.py
+
+shared_inputs:
+  data: &data {pipe}("{{datasite}}/data/{data}")
+  output: &output {pipe}("{{datasite}}/fedreduce/{{project}}/data/{{step}}/{result}")
+
+shared_outputs:
+  result: &result {pipe}("{{author}}/fedreduce/{{project}}/data/result/{result}")
+
+workflow:
+  datasites: &datasites []
+  topology: {topology}
+  fan_in: {fan_in}
+
+steps:
+  - first:
+      inputs:
+        - a: StaticPipe(0)
+  - last:
+      output:
+        path: *result
+        permissions:
+          read:
+            - *datasites
+  - foreach: *datasites
+    run: "{{datasite}}"
+    function: "{function}"
+    inputs:
+      - a: {pipe}("{{prev_datasite}}/fedreduce/{{project}}/data/{{prev_step}}/{result}")
+      - b: *data
+    output:
+      path: *output
+      permissions:
+        read:
+          - "{{next_datasite}}"
+
+complete:
+  exists: *result
+"""
+
+# the project's own code, a binary add that overrides the built-in reducer
+# of the same name, so `--function add` goes through registry.adapt
+FUNCTIONS_PY = """def add(x, y):
+    return x + y
+"""
+
+# how each pipe format names its files and what it reduces with
+FORMATS = {
+    "file": {"pipe": "FilePipe", "data": "data.txt", "result": "result.txt"},
+    "array": {"pipe": "ArrayPipe", "data": "data.npy", "result": "result.npy"},
+    "chunked": {"pipe": "ChunkedPipe", "data": "chunked", "result": "result"},
+}
+
+
+def datasite_email(i: int) -> str:
+    return f"sim{i:04d}@openmined.org"
+
+
+def owner_of(rel: str) -> str:
+    return rel.split(os.sep, 1)[0]
+
+
+class FakeSync:
+    """Copies files between the sync folders of virtual datasites.
+
+    A datasite's own files are sent to every datasite the nearest
+    `_.syftperm` lets read them. Files a datasite writes into another
+    datasite's `fedreduce` folder are uploaded to that owner if the nearest
+    `_.syftperm` gives the writer write access. Each copy lands `delay` plus
+    up to `jitter` seconds after it was picked up, renamed into place so it
+    appears whole, and copies of the same file arrive in order.
+    """
+
+    def __init__(self, folders, delay=0.1, jitter=0.0, interval=0.02, seed=0):
+        self.folders = folders
+        self.delay = delay
+        self.jitter = jitter
+        self.interval = interval
+        self.random = random.Random(seed)
+        # (recipient, rel) -> signature of the source copy last sent there
+        self.sent = {}
+        # (datasite, rel) -> signature of the copy the sync wrote there
+        self.local = {}
+        self.due = {}
+        self.queue = []
+        self.sequence = 0
+        # (recipient, rel) -> when the latest copy landed
+        self.arrivals = {}
+        self.bytes = 0
+        self.files = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _loop(self):
+        while not self.stopped.is_set():
+            for email in self.folders:
+                self.scan(email)
+            now = time.time()
+            while self.queue and self.queue[0][0] <= now:
+                _, _, sender, recipient, rel, data = heapq.heappop(self.queue)
+                self.deliver(sender, recipient, rel, data)
+            self.stopped.wait(self.interval)
+
+    def _permission(self, email, rel_dir):
+        """The nearest permission file at or above `rel_dir`, within the
+        datasite the path belongs to."""
+        folder = self.folders[email]
+        parts = rel_dir.split(os.sep)
+        while parts:
+            path = folder.joinpath(*parts, PERMISSION_FILE)
+            try:
+                with open(path, "r") as file:
+                    return json.load(file)
+            except (OSError, ValueError):
+                parts.pop()
+        return {}
+
+    def _files(self, email, rel_root):
+        folder = self.folders[email]
+        for root, _, names in os.walk(folder / rel_root):
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield os.path.relpath(path, folder), (stat.st_size, stat.st_mtime_ns)
+
+    def scan(self, email):
+        permissions = {}
+
+        def permission(rel):
+            rel_dir = os.path.dirname(rel)
+            if rel_dir not in permissions:
+                permissions[rel_dir] = self._permission(email, rel_dir)
+            return permissions[rel_dir]
+
+        # our own files, to everyone allowed to read them
+        current = set()
+        for rel, signature in self._files(email, email):
+            current.add(rel)
+            readers = permission(rel).get("read", [])
+            for recipient in self.folders:
+                if recipient == email:
+                    continue
+                if "GLOBAL" not in readers and recipient not in readers:
+                    continue
+                self._send(email, recipient, rel, signature)
+        for recipient, rel in list(self.sent):
+            if owner_of(rel) == email and recipient != email and rel not in current:
+                self._schedule(email, recipient, rel, None)
+
+        # our writes into other datasites, to their owner
+        for owner in self.folders:
+            if owner == email:
+                continue
+            for rel, signature in self._files(email, os.path.join(owner, APP_NAME)):
+                if self.local.get((email, rel)) == signature:
+                    continue
+                if email in permission(rel).get("write", []):
+                    self._send(email, owner, rel, signature)
+
+    def _send(self, sender, recipient, rel, signature):
+        if self.sent.get((recipient, rel)) == signature:
+            return
+        try:
+            with open(self.folders[sender] / rel, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return
+        self.sent[(recipient, rel)] = signature
+        self._schedule(sender, recipient, rel, data)
+
+    def _schedule(self, sender, recipient, rel, data):
+        if data is None:
+            self.sent.pop((recipient, rel), None)
+        due = time.time() + self.delay + self.random.uniform(0, self.jitter)
+        # a later copy never overtakes an earlier one
+        due = max(due, self.due.get((recipient, rel), 0))
+        self.due[(recipient, rel)] = due
+        self.sequence += 1
+        heapq.heappush(self.queue, (due, self.sequence, sender, recipient, rel, data))
+
+    def deliver(self, sender, recipient, rel, data):
+        path = self.folders[recipient] / rel
+        if data is None:
+            self.local.pop((recipient, rel), None)
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+            return
+        os.makedirs(path.parent, exist_ok=True)
+        tmp_path = path.parent / f".{path.name}.sync.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+        stat = os.stat(path)
+        signature = (stat.st_size, stat.st_mtime_ns)
+        self.local[(recipient, rel)] = signature
+        if recipient == owner_of(rel):
+            # the owner doesn't send an upload back to the datasite it came from
+            self.sent[(sender, rel)] = signature
+        self.arrivals[(recipient, rel)] = time.time()
+        self.bytes += len(data)
+        self.files += 1
+
+
+def write_data(pipe_format, path, value, size):
+    from sdk import ArrayPipe, ChunkedPipe, FilePipe
+
+    if pipe_format == "file":
+        FilePipe(path).write(value)
+        return
+    import numpy as np
+
+    array = np.full(size, value, dtype=np.float32)
+    if pipe_format == "array":
+        ArrayPipe(path).write(array)
+    else:
+        ChunkedPipe(path, chunk_size=max(size // 4, 1)).write(array)
+
+
+def read_result(pipe_format, path):
+    from sdk import ArrayPipe, ChunkedPipe, FilePipe
+
+    pipe = {"file": FilePipe, "array": ArrayPipe, "chunked": ChunkedPipe}[pipe_format]
+    value = pipe(path).read()
+    if pipe_format == "file":
+        return value
+    return float(value.reshape(-1)[0])
+
+
+class Simulation:
+    """One project on `datasites` virtual datasites, the first is the author."""
+
+    def __init__(self, workdir, args, topology, pipe_format):
+        self.workdir = Path(workdir)
+        self.args = args
+        self.topology = topology
+        self.pipe_format = pipe_format
+        self.emails = [datasite_email(i) for i in range(args.datasites)]
+        self.author = self.emails[0]
+        self.folders = {
+            email: self.workdir / "clients" / str(i) / "datasites"
+            for i, email in enumerate(self.emails)
+        }
+        self.sync = FakeSync(
+            self.folders, args.delay, args.jitter, args.scan_interval, args.seed
+        )
+        self.times = {}
+        self.projects = {}
+        self.errors = []
+
+    def public(self, email, viewer=None):
+        folder = self.folders[viewer or email]
+        return folder / email / "public" / APP_NAME
+
+    def setup(self):
+        from syftbox.lib import SyftPermission
+
+        spec = FORMATS[self.pipe_format]
+        for i, email in enumerate(self.emails):
+            # what create_folders sets up for every datasite running the app
+            public = self.public(email)
+            for state in ("invite", "join", "running"):
+                os.makedirs(public / state, exist_ok=True)
+            SyftPermission.mine_with_public_read(email).ensure(public)
+            data = self.folders[email] / email / "data" / spec["data"]
+            os.makedirs(data.parent, exist_ok=True)
+            write_data(self.pipe_format, data, i + 1, self.args.size)
+
+        invite = self.public(self.author) / "invite" / PROJECT
+        os.makedirs(invite)
+        (invite / f"{PROJECT}.yaml").write_text(
+            PROJECT_YAML.format(
+                author=self.author,
+                project=PROJECT,
+                topology=self.topology,
+                datasites=len(self.emails),
+                fan_in=self.args.fan_in,
+                function=self.args.function,
+                **spec,
+            )
+        )
+        (invite / "functions.py").write_text(FUNCTIONS_PY)
+
+    def run(self):
+        self.setup()
+        self.sync.start()
+        self.times["invite"] = time.time()
+        threads = [
+            threading.Thread(target=self.datasite, args=(email,))
+            for email in self.emails
+        ]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            self.sync.stop()
+        return self.report()
+
+    def deadline_passed(self):
+        return time.time() > self.times["invite"] + self.args.timeout
+
+    def datasite(self, email):
+        try:
+            self._datasite(email)
+        except Exception as e:
+            self.errors.append(f"{email}: {e!r}")
+
+    def _datasite(self, email):
+        """The ticks of one datasite, until its part of the project is done."""
+        from syftbox.lib import Client
+        from commands import run_command
+        from index import load_index
+
+        client = Client(email, self.folders[email])
+        index = load_index(client, filename=str(self.workdir / f"index-{email}.json"))
+        source = f"/datasites/{self.author}/{APP_NAME}/invite/{PROJECT}"
+        invite = self.public(self.author, email) / "invite" / PROJECT
+        running = self.public(self.author, email) / "running" / PROJECT
+        joined = False
+
+        while not self.deadline_passed():
+            if not joined and (invite / f"{PROJECT}.yaml").exists():
+                run_command(
+                    client,
+                    index,
+                    {"command": "join", "source": source, "state": "join"},
+                )
+                self.times[f"joined:{email}"] = time.time()
+                joined = True
+
+            if email == self.author and "start" not in self.times:
+                index.refresh()
+                joins = index.glob(state="join", author=email, project=PROJECT)
+                if len(joins) == len(self.emails):
+                    output, _ = run_command(
+                        client, index, {"command": "start", "source": source}
+                    )
+                    if output.get("error"):
+                        raise RuntimeError(output["error"])
+                    self.times["start"] = time.time()
+
+            if joined and self.running(client, running):
+                if self.advance(client):
+                    return
+            time.sleep(self.args.tick)
+
+    def running(self, client, running) -> bool:
+        """Takes the project from join to running once its files arrived,
+        like `run_projects` does."""
+        from lifecycle import snapshot_tree
+        from yaml_cache import load_yaml
+
+        if client.email in self.projects:
+            return True
+        yaml_file = running / f"{PROJECT}.yaml"
+        if not yaml_file.exists():
+            return False
+        pipeline = load_yaml(yaml_file)
+        code = [running / name for name in pipeline.get("code", [])]
+        if not pipeline["workflow"]["datasites"] or not all(
+            path.exists() for path in code
+        ):
+            return False
+
+        public = self.public(client.email)
+        join_marker = public / "join" / self.author / f"{PROJECT}.yaml.join"
+        os.makedirs(public / "running" / self.author, exist_ok=True)
+        os.replace(join_marker, public / "running" / self.author / join_marker.name)
+        project_path = client.sync_folder / client.email / APP_NAME / "running"
+        project_path = project_path / PROJECT
+        snapshot_tree(running, project_path)
+        self.projects[client.email] = project_path
+        self.times[f"running:{client.email}"] = time.time()
+        return True
+
+    def advance(self, client) -> bool:
+        """One tick of a running project. True once this datasite is done."""
+        from run import check_done, run_steps_for_email
+        from yaml_cache import load_yaml
+
+        project_path = self.projects[client.email]
+        pipeline = load_yaml(project_path / f"{PROJECT}.yaml")
+        log_file = str(
+            self.public(client.email) / "running" / self.author / f"{PROJECT}.yaml.log"
+        )
+        done = run_steps_for_email(
+            client,
+            pipeline,
+            log_file=log_file,
+            timeout=self.args.step_timeout,
+            project_path=project_path,
+        )
+        if done and f"done:{client.email}" not in self.times:
+            self.times[f"done:{client.email}"] = time.time()
+        if client.email != self.author:
+            return done
+
+        project = {"author": self.author, "api_name": PROJECT}
+        project["project_path"] = project_path
+        complete, _ = check_done(
+            client, pipeline, project, log_file, timeout=self.args.step_timeout
+        )
+        if complete:
+            self.times["complete"] = time.time()
+        return bool(complete)
+
+    def hops(self):
+        """Every input a step read from another datasite: when the producer
+        wrote it, when it landed here and when the step's output was written."""
+        from run import get_plan
+        from syftbox.lib import Client
+        from yaml_cache import load_yaml
+
+        arrivals = {}
+        for (recipient, rel), arrived in self.sync.arrivals.items():
+            arrivals.setdefault(recipient, []).append((rel, arrived))
+
+        hops = []
+        for email, project_path in self.projects.items():
+            client = Client(email, self.folders[email])
+            pipeline = load_yaml(project_path / f"{PROJECT}.yaml")
+            plan = get_plan(client, pipeline, project_path)
+            steps = list(plan.steps_for(email))
+            if email == self.author and plan.reduce is not None:
+                steps.append(plan.reduce)
+            for step in steps:
+                finished = newest_mtime(step.output.watch_paths())
+                for pipe in step.inputs.values():
+                    if not hasattr(pipe, "file_path"):
+                        continue
+                    rel = os.path.relpath(pipe.file_path, client.sync_folder)
+                    producer = owner_of(rel)
+                    if producer == email:
+                        continue
+                    landed = [
+                        arrived
+                        for path, arrived in arrivals.get(email, [])
+                        if path == rel or path.startswith((f"{rel}.", f"{rel}/"))
+                    ]
+                    produced = newest_mtime(
+                        os.path.join(self.folders[producer], path)
+                        for path in pipe_paths(pipe, client.sync_folder)
+                    )
+                    if not landed or produced is None or finished is None:
+                        continue
+                    hops.append(
+                        {
+                            "from": producer,
+                            "to": email,
+                            "step": step.step_num,
+                            "transit": max(landed) - produced,
+                            "pickup": finished - max(landed),
+                            "wait": finished - produced,
+                        }
+                    )
+        return hops
+
+    def report(self):
+        hops = self.hops()
+        start = self.times.get("start")
+        complete = self.times.get("complete")
+        spec = FORMATS[self.pipe_format]
+        result = None
+        if complete:
+            result = read_result(
+                self.pipe_format,
+                self.folders[self.author]
+                / self.author
+                / APP_NAME
+                / PROJECT
+                / "data"
+                / "result"
+                / spec["result"],
+            )
+        count = len(self.emails)
+        return {
+            "topology": self.topology,
+            "format": self.pipe_format,
+            "complete": complete is not None,
+            "correct": result == count * (count + 1) / 2,
+            "errors": self.errors,
+            "join_seconds": start - self.times["invite"] if start else None,
+            "critical_path_seconds": complete - start if complete and start else None,
+            "bytes_synced": self.sync.bytes,
+            "files_synced": self.sync.files,
+            "hop_summary": {
+                key: summarize([hop[key] for hop in hops])
+                for key in ("transit", "pickup", "wait")
+            },
+            "hops": hops,
+        }
+
+
+def pipe_paths(pipe, sync_folder):
+    """The files behind a pipe, relative to the sync folder."""
+    paths = [pipe.file_path, *pipe.watch_paths()]
+    return {os.path.relpath(path, sync_folder) for path in paths}
+
+
+def newest_mtime(paths):
+    mtimes = []
+    for path in paths:
+        with contextlib.suppress(OSError):
+            mtimes.append(os.stat(path).st_mtime)
+    return max(mtimes) if mtimes else None
+
+
+def summarize(values):
+    if not values:
+        return None
+    return {
+        "count": len(values),
+        "mean": statistics.mean(values),
+        "p50": statistics.median(values),
+        "max": max(values),
+    }
+
+
+def simulate(args, topology, pipe_format):
+    import permissions
+    import registry
+    import run
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        # step state, the YAML cache and indexes are written to the cwd
+        os.chdir(workdir)
+        run._compiled_plans.clear()
+        registry._module_cache.clear()
+        permissions._manager = None
+        try:
+            simulation = Simulation(workdir, args, topology, pipe_format)
+            with contextlib.redirect_stdout(io.StringIO()):
+                return simulation.run()
+        finally:
+            from logs import flush_logs
+
+            flush_logs()
+            os.chdir(cwd)
+
+
+def seconds(value):
+    return f"{value:8.3f}s" if value is not None else "       -"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--datasites", type=int, default=10)
+    parser.add_argument(
+        "--topology", nargs="+", default=["ring"], choices=["ring", "tree", "star"]
+    )
+    parser.add_argument("--fan-in", type=int, default=2)
+    parser.add_argument(
+        "--function",
+        default="sum",
+        choices=["sum", "add"],
+        help="the built-in reducer, or a binary add in the project's own code",
+    )
+    parser.add_argument("--format", nargs="+", default=["file"], choices=FORMATS)
+    parser.add_argument("--size", type=int, default=1000, help="array elements")
+    parser.add_argument("--delay", type=float, default=0.1, help="seconds per hop")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random delay")
+    parser.add_argument("--scan-interval", type=float, default=0.02)
+    parser.add_argument("--tick", type=float, default=0.05, help="seconds per tick")
+    parser.add_argument(
+        "--step-timeout", type=float, default=0.0, help="project_timeout of each tick"
+    )
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    results = []
+    for topology in args.topology:
+        for pipe_format in args.format:
+            result = simulate(args, topology, pipe_format)
+            results.append(result)
+            wait = result["hop_summary"]["wait"] or {}
+            print(
+                f"{topology:5} {pipe_format:8} "
+                f"complete={result['complete']!s:5} correct={result['correct']!s:5} "
+                f"join {seconds(result['join_seconds'])} "
+                f"critical path {seconds(result['critical_path_seconds'])} "
+                f"hop wait mean {seconds(wait.get('mean'))} "
+                f"max {seconds(wait.get('max'))} "
+                f"{result['bytes_synced']:12d} bytes synced"
+            )
+            for error in result["errors"]:
+                print(f"  error: {error}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"config": vars(args), "results": results}, file, indent=2)
+        print(f"results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    stand_in.install(datasite_email(0), tempfile.gettempdir())
+    main()
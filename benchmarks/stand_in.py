@@ -0,0 +1,55 @@
+"""Local stand-in for `syftbox.lib`, so benchmarks can import the app without
+a SyftBox client or server.
+
+    install(email, sync_folder)
+    import app  # app.client is now a stand-in Client
+"""
+
+import json
+import sys
+import types
+from pathlib import Path
+
+
+class Client:
+    """Only what the app uses: the datasite's email and its sync folder."""
+
+    default = None
+
+    def __init__(self, email, sync_folder):
+        self.email = email
+        self.sync_folder = Path(sync_folder)
+
+    @classmethod
+    def load(cls):
+        return cls(*cls.default)
+
+
+class SyftPermission:
+    def __init__(self, admin, read, write):
+        self.admin = admin
+        self.read = read
+        self.write = write
+
+    @classmethod
+    def mine_with_public_read(cls, email):
+        return cls(admin=[email], read=[email, "GLOBAL"], write=[email])
+
+    def ensure(self, folder):
+        path = Path(folder) / "_.syftperm"
+        data = json.dumps({"admin": self.admin, "read": self.read, "write": self.write})
+        if not path.exists() or path.read_text() != data:
+            path.write_text(data)
+
+
+def install(email, sync_folder):
+    """Registers the stand-in as `syftbox.lib` with `Client.load()` returning
+    `email` on `sync_folder`."""
+    Client.default = (email, sync_folder)
+    package = types.ModuleType("syftbox")
+    lib = types.ModuleType("syftbox.lib")
+    lib.Client = Client
+    lib.SyftPermission = SyftPermission
+    package.lib = lib
+    sys.modules["syftbox"] = package
+    sys.modules["syftbox.lib"] = lib
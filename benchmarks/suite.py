@@ -0,0 +1,310 @@
+"""Benchmark the app's entry points on a synthetic sync folder.
+
+Reports wall time, filesystem call counts and peak Python memory for
+generate_home, run_projects, the command.py list_projects fallback, the
+command service's list_projects and the idle-tick check, each with cold
+caches and again warm. Results are saved as JSON. Pass an earlier results
+file as --baseline to compare against it.
+
+    python benchmarks/suite.py --datasites 200 --projects 2 --joins 5 \\
+        --log-lines 200 --output results.json --baseline previous.json
+
+syftbox is replaced by a local stand-in, see stand_in.py.
+"""
+
+import argparse
+import builtins
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import stand_in  # noqa: E402
+from synthetic import datasite_email, make_sync_folder  # noqa: E402
+
+# filesystem calls we count, by the module attribute they are looked up from
+COUNTED_CALLS = {
+    "stat": (os, "stat"),
+    "lstat": (os, "lstat"),
+    "scandir": (os, "scandir"),
+    "listdir": (os, "listdir"),
+    "open": (builtins, "open"),
+    "io.open": (io, "open"),
+}
+# files the app keeps in its working directory between ticks
+CACHE_FILES = [
+    "index.json",
+    "yaml_cache.pickle",
+    "activity_state.json",
+    "tick.json",
+    "permissions.json",
+    "publish_manifest.json",
+    "verified_payloads.json",
+    "state",
+]
+
+
+@contextlib.contextmanager
+def count_calls():
+    """Counts filesystem calls made through the os and open functions while
+    active. Calls made from C code, like pathlib's, are not seen."""
+    counts = Counter()
+    originals = {}
+
+    def wrap(name, function):
+        def counted(*args, **kwargs):
+            counts[name] += 1
+            return function(*args, **kwargs)
+
+        return counted
+
+    for name, (module, attr) in COUNTED_CALLS.items():
+        originals[name] = getattr(module, attr)
+        setattr(module, attr, wrap(name, originals[name]))
+    try:
+        yield counts
+    finally:
+        for name, (module, attr) in COUNTED_CALLS.items():
+            setattr(module, attr, originals[name])
+
+
+def reset_caches(app_dir):
+    """Forget everything a previous tick left behind, on disk and in memory."""
+    import permissions
+    import registry
+    import run
+    import sdk
+    import yaml_cache
+
+    for name in CACHE_FILES:
+        path = app_dir / name
+        if path.is_dir():
+            shutil.rmtree(path)
+        elif path.exists():
+            path.unlink()
+    yaml_cache._yaml_cache = None
+    permissions._manager = None
+    sdk._publish_manifest = None
+    sdk._verified_payloads = None
+    run._compiled_plans.clear()
+    registry._module_cache.clear()
+
+
+def prepare_idle_tick(app):
+    """Runs a full tick, then retakes its snapshot once every mtime is out of
+    the racy window, so the next check can actually skip."""
+    import tick
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        app.main()
+    time.sleep(tick.RACY_WINDOW_NS / 1e9 + 0.1)
+    with open(tick.TICK_FILE, "r") as file:
+        paths = json.load(file)["files"]
+    snapshot = tick.take_snapshot(app.client.sync_folder, app.client.email, paths)
+    tick.save_tick(snapshot)
+
+
+def measure(entry, context):
+    """Runs `entry` once, counting fs calls and tracing memory in that same
+    run, so a cold measurement is cold for every number. Wall time includes
+    the tracing overhead, alike for cold and warm runs."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        # a fresh trace per run, the peak of the previous run doesn't carry over
+        tracemalloc.start()
+        try:
+            with count_calls() as counts:
+                start = time.perf_counter()
+                entry(context)
+                wall = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {
+        "wall_ms": round(wall * 1000, 3),
+        "calls": dict(sorted(counts.items())),
+        "fs_calls": sum(counts.values()),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def entry_generate_home(context):
+    from index import load_index
+
+    app = context["app"]
+    app.index = load_index(app.client)
+    app.generate_home()
+    app.index.save()
+
+
+def entry_run_projects(context):
+    from index import load_index
+    from logs import flush_logs
+
+    app = context["app"]
+    app.index = load_index(app.client)
+    app.run_projects()
+    app.index.save()
+    flush_logs()
+
+
+def entry_list_projects_cli(context):
+    # what command.py does when no service is running
+    from commands import run_command
+    from index import load_index
+
+    app = context["app"]
+    index = load_index(app.client)
+    index.save()
+    run_command(app.client, index, {"command": "list_projects"})
+
+
+def entry_list_projects_service(context):
+    from index import load_index
+    from service import CommandService
+
+    if "service" not in context:
+        app = context["app"]
+        context["service"] = CommandService(app.client, load_index(app.client))
+    context["service"].handle({"command": "list_projects"})
+
+
+def entry_tick_skip(context):
+    import tick
+
+    tick.can_skip()
+
+
+ENTRIES = {
+    "generate_home": entry_generate_home,
+    "run_projects": entry_run_projects,
+    "list_projects_cli": entry_list_projects_cli,
+    "list_projects_service": entry_list_projects_service,
+    "tick_skip": entry_tick_skip,
+}
+
+
+def code_version():
+    try:
+        return subprocess.run(
+            ["git", "-C", str(ROOT), "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_file):
+    with open(baseline_file, "r") as file:
+        baseline = json.load(file)["results"]
+    print(f"\ncompared with {baseline_file}")
+    for entry, phases in results.items():
+        for phase, result in phases.items():
+            before = baseline.get(entry, {}).get(phase)
+            if not before or not before["wall_ms"]:
+                continue
+            ratio = result["wall_ms"] / before["wall_ms"]
+            print(
+                f"{entry:24} {phase:5} {before['wall_ms']:10.1f} ms -> "
+                f"{result['wall_ms']:10.1f} ms  x{ratio:5.2f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--datasites", type=int, default=100)
+    parser.add_argument("--projects", type=int, default=2)
+    parser.add_argument("--joins", type=int, default=5)
+    parser.add_argument("--log-lines", type=int, default=100)
+    parser.add_argument("--entries", nargs="*", choices=sorted(ENTRIES))
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline")
+    args = parser.parse_args()
+    entries = args.entries or list(ENTRIES)
+
+    cwd = os.getcwd()
+    output = os.path.abspath(args.output)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        start = time.perf_counter()
+        datasites_root = make_sync_folder(
+            tmp / "sync",
+            datasites=args.datasites,
+            projects_per_state=args.projects,
+            joins_per_project=args.joins,
+            log_lines=args.log_lines,
+        )
+        generate_time = time.perf_counter() - start
+
+        # the app reads its settings and widget files from the working dir
+        app_dir = tmp / "app"
+        shutil.copytree(ROOT / "widget", app_dir / "widget")
+        (app_dir / "settings.json").write_text(
+            json.dumps({"run_analysis": True, "project_timeout": 0})
+        )
+        os.chdir(app_dir)
+
+        # a datasite that joined projects in every state
+        stand_in.install(datasite_email(1), datasites_root)
+        with contextlib.redirect_stdout(io.StringIO()):
+            import app
+
+        context = {"app": app}
+        results = {}
+        try:
+            for name in entries:
+                reset_caches(app_dir)
+                context.pop("service", None)
+                if name == "tick_skip":
+                    prepare_idle_tick(app)
+                cold = measure(ENTRIES[name], context)
+                warm = measure(ENTRIES[name], context)
+                results[name] = {"cold": cold, "warm": warm}
+                for phase, result in results[name].items():
+                    print(
+                        f"{name:24} {phase:5} {result['wall_ms']:10.1f} ms "
+                        f"{result['fs_calls']:8d} fs calls "
+                        f"{result['peak_kib']:10.1f} KiB peak"
+                    )
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        "version": code_version(),
+        "created": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "datasites": args.datasites,
+            "projects_per_state": args.projects,
+            "joins_per_project": args.joins,
+            "log_lines": args.log_lines,
+            "generate_seconds": round(generate_time, 3),
+        },
+        "results": results,
+    }
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"results saved to {output}")
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from logs import JsonFormatter, SegmentedLogHandler  # noqa: E402
+
+PROJECT_YAML = """author: "{author}"
+project: "{project}"
+language: "python"
+description: "Synthetic project {project}"
+code:
+  - functions.py
+
+shared_inputs:
+  data: &data FilePipe("{{datasite}}/data/data.txt")
+  output: &output FilePipe("{{datasite}}/fedreduce/{{project}}/data/{{step}}/result.txt")
+
+shared_outputs:
+  result: &result FilePipe("{{author}}/fedreduce/{{project}}/data/result/result.txt")
+
+workflow:
+  datasites: &datasites {datasites}
+
+steps:
+  - first:
+      inputs:
+        - a: StaticPipe(0)
+  - last:
+      output:
+        path: *result
+        permissions:
+          read:
+            - *datasites
+  - foreach: *datasites
+    run: "{{datasite}}"
+    function: "add"
+    inputs:
+      - a: FilePipe("{{prev_datasite}}/fedreduce/{{project}}/data/{{prev_step}}/result.txt")
+      - b: *data
+    output:
+      path: *output
+      permissions:
+        read:
+          - "{{next_datasite}}"
+
+complete:
+  exists: *result
+"""
+
+FUNCTIONS_PY = """def add(x, y):
+    return x + y
+"""
+
+
+def datasite_email(i: int) -> str:
+    return f"user{i:04d}@openmined.org"
+
+
+def make_sync_folder(
+    root,
+    datasites: int = 100,
+    projects_per_state: int = 2,
+    joins_per_project: int = 5,
+    states=("invite", "running", "complete"),
+    log_lines: int = 0,
+) -> Path:
+    """Create a synthetic SyftBox sync folder under `root/datasites`.
+
+    Every datasite authors `projects_per_state` projects in each state, and
+    the following `joins_per_project` datasites hold a join marker for each
+    of them in the matching public folder. Running and complete projects have
+    those datasites in their workflow, and every joined datasite has written
+    `log_lines` lines to the project's log.
+    """
+    datasites_root = Path(root) / "datasites"
+    emails = [datasite_email(i) for i in range(datasites)]
+
+    for i, author in enumerate(emails):
+        public = datasites_root / author / "public" / "fedreduce"
+        data = datasites_root / author / "data"
+        os.makedirs(data, exist_ok=True)
+        (data / "data.txt").write_text(str(i))
+
+        for state in states:
+            for p in range(projects_per_state):
+                project = f"{state}{p}"
+                project_folder = public / state / project
+                os.makedirs(project_folder, exist_ok=True)
+                members = [
+                    emails[(i + j) % datasites] for j in range(1, joins_per_project + 1)
+                ]
+                workflow = [author] + members if state != "invite" else []
+                (project_folder / f"{project}.yaml").write_text(
+                    PROJECT_YAML.format(
+                        author=author, project=project, datasites=json.dumps(workflow)
+                    )
+                )
+                (project_folder / "functions.py").write_text(FUNCTIONS_PY)
+
+                join_state = "join" if state == "invite" else state
+                for member in members:
+                    join_folder = (
+                        datasites_root
+                        / member
+                        / "public"
+                        / "fedreduce"
+                        / join_state
+                        / author
+                    )
+                    os.makedirs(join_folder, exist_ok=True)
+                    (join_folder / f"{project}.yaml.join").touch()
+                    if log_lines and state != "invite":
+                        write_log(join_folder / f"{project}.yaml.log", log_lines)
+
+    return datasites_root
+
+
+def write_log(log_file, lines: int):
+    """A project log as the app writes it: segments plus their index."""
+    handler = SegmentedLogHandler(log_file)
+    handler.setFormatter(JsonFormatter())
+    for line in range(lines):
+        record = logging.makeLogRecord(
+            {
+                "msg": "Step %s waiting for inputs.",
+                "args": (line,),
+                "levelname": "INFO",
+                "levelno": logging.INFO,
+                "step": line,
+            }
+        )
+        handler.handle(record)
+    handler.close()
@@ -0,0 +1,164 @@
+"""Handlers for the widget's JSON commands, shared by the command service and
+the `command.py` fallback.
+
+Each handler takes the client, an up to date project index and the parsed
+request, and returns the JSON response with an exit code.
+"""
+
+import os
+import shutil
+from typing import Any, Tuple
+
+from lifecycle import move_path
+from sdk import extract_datasite
+from yaml_cache import get_yaml_cache
+
+APP_NAME = "fedreduce"
+
+
+def load_yaml(yaml_file_path):
+    # ruamel keeps quotes and anchors when we write the project back, it is
+    # only needed when a start changes the datasites
+    from ruamel.yaml import YAML
+
+    yaml = YAML()
+    yaml.preserve_quotes = True  # Preserve quotes around values
+    yaml.indent(mapping=2, sequence=4, offset=2)  # Customize indentation if needed
+    with open(yaml_file_path, "r") as file:
+        return yaml, yaml.load(file)
+
+
+def find_first_yaml_file(directory):
+    for root, _, files in os.walk(directory):
+        for file in files:
+            if file.endswith(".yaml"):
+                return os.path.join(root, file)
+    return None
+
+
+def join(client, index, data) -> Tuple[Any, int]:
+    after_datasite = str(data["source"]).split("/datasites/")[-1]
+    source_path = client.sync_folder / after_datasite.replace(
+        "/fedreduce/", "/public/fedreduce/"
+    )
+    yaml_file = find_first_yaml_file(source_path)
+    yaml_file_name = os.path.basename(str(yaml_file))
+    datasite = extract_datasite(data["source"])
+    folder = client.sync_folder / client.email / "public" / APP_NAME / "join" / datasite
+    if data["state"] == "join":
+        os.makedirs(folder, exist_ok=True)
+        join_file = folder / f"{yaml_file_name}.join"
+        join_file.touch(exist_ok=True)
+        return {"result": "success"}, 0
+    elif data["state"] == "leave":
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+        return {"result": "success"}, 0
+    return None, 0
+
+
+def list_projects(client, index, data) -> Tuple[Any, int]:
+    response = []
+    for datasite, join_path in index.glob(datasite=client.email, kind="join"):
+        project = {}
+        if "/join/" in str(join_path):
+            state = "join"
+        elif "/running/" in str(join_path):
+            state = "running"
+        elif "/complete/" in str(join_path):
+            state = "complete"
+        else:
+            state = "unknown"
+        project["state"] = state
+        last = str(join_path).split("public/fedreduce/")[-1]
+        parts = last.split("/")
+        author = None
+        for part in parts:
+            if "@" in part:
+                author = part
+        project["author"] = author
+        api_name = join_path.name.split(".yaml")[0]
+
+        project["sourceUrl"] = (f"/datasites/{author}/fedreduce/invite/{api_name}",)
+        response.append(project)
+    return response, 0
+
+
+def start(client, index, data) -> Tuple[Any, int]:
+    path = data["source"]
+    datasite = extract_datasite(path)
+    if "/fedreduce/invite/" not in path:
+        return {"error": f"not a valid path. {path}"}, 1
+    if datasite != client.email:
+        return {"error": "Not your project, not authorized"}, 1
+    project_name = path.split("/fedreduce/invite/")[-1]
+
+    # get everyone who has asked to join
+    datasites_joining = index.glob(
+        state="join", author=client.email, project=project_name
+    )
+
+    join_match = f"/join/{client.email}/{project_name}.yaml.join"
+    joining_datasites = []
+    for datasite, join_path in datasites_joining:
+        if join_match in str(join_path):
+            joining_datasites.append(datasite)
+
+    redreduce_folder = client.sync_folder / client.email / "public" / APP_NAME
+
+    invite_folder = redreduce_folder / "invite" / project_name
+    running_folder = redreduce_folder / "running"
+    yaml_file = find_first_yaml_file(invite_folder)
+    if yaml_file is not None:
+        yaml_cache = get_yaml_cache()
+        cached_project = yaml_cache.load(yaml_file)
+        datasites = list(cached_project.get("workflow", {}).get("datasites", []))
+        merged_datasites = sorted(list(set(datasites + joining_datasites)))
+
+        # only round-trip through ruamel when the datasites change,
+        # so quotes and anchors survive and the file isn't rewritten
+        if datasites != merged_datasites:
+            yaml, project = load_yaml(yaml_file)
+            if "workflow" not in project:
+                project["workflow"] = {}
+
+            project["workflow"]["datasites"] = merged_datasites
+            with open(yaml_file, "w") as file:
+                yaml.dump(project, file)
+        yaml_cache.save()
+
+    os.makedirs(running_folder, exist_ok=True)
+
+    if not os.path.exists(invite_folder) and os.path.exists(
+        running_folder / project_name
+    ):
+        # already running
+        return {"result": "success"}, 0
+
+    if not os.path.exists(invite_folder):
+        return {"error": "Not a valid project"}, 1
+
+    # a rename, whatever the size of the project
+    move_path(invite_folder, running_folder / project_name)
+    return {"result": "success"}, 0
+
+
+COMMANDS = {
+    "join": join,
+    "list_projects": list_projects,
+    "start": start,
+}
+
+# commands that change the sync folder, the index is stale after them
+WRITE_COMMANDS = {"join", "start"}
+
+
+def run_command(client, index, data) -> Tuple[Any, int]:
+    """Dispatches one request, turning failures into an error response."""
+    try:
+        handler = COMMANDS.get(data["command"])
+        if handler is None:
+            return {"error": f"Unknown command: {data['command']}"}, 1
+        return handler(client, index, data)
+    except Exception as e:
+        return {"error": str(e)}, 1
@@ -1,6 +1,2 @@
-def add(x, y):
-    return x + y
-
-
 def multiply(x, y):
     return x * y
@@ -0,0 +1,211 @@
+import os
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from sdk import datasites_path
+
+APP_NAME = "fedreduce"
+
+STATES = ("invite", "join", "running", "complete")
+
+# directories modified this close to a scan can change again within the same
+# mtime tick, so they are always rescanned (same idea as git's "racy" entries)
+RACY_WINDOW_NS = 2_000_000_000
+
+
+def classify(datasite: str, parts: List[str]) -> Dict[str, Optional[str]]:
+    """Work out state, author, project and kind for a file inside a datasite's
+    public fedreduce folder, given its path parts relative to that folder.
+
+    Layouts:
+        <state>/<project>/<file>                 author's own project files
+        <state>/<author>/<project>.yaml.join     join markers of a participant
+        <state>/<author>/<project>.yaml.log      logs of a participant
+        <state>/<author>/<project>.yaml.metrics.json
+                                                 step timings of a participant
+    """
+    file_name = parts[-1]
+    state = parts[0] if len(parts) > 1 and parts[0] in STATES else None
+    author = None
+    project = None
+    kind = "file"
+
+    if state and len(parts) >= 3:
+        if "@" in parts[1]:
+            author = parts[1]
+            project = file_name.split(".yaml")[0]
+            if file_name.endswith(".yaml.join"):
+                kind = "join"
+            elif ".yaml.log" in file_name:
+                kind = "log"
+            elif file_name.endswith(".yaml.metrics.json"):
+                kind = "metrics"
+        else:
+            author = datasite
+            project = parts[1]
+            if file_name.endswith(".yaml"):
+                kind = "yaml"
+
+    return {
+        "datasite": datasite,
+        "state": state,
+        "author": author,
+        "project": project,
+        "kind": kind,
+    }
+
+
+class ProjectIndex:
+    """Persistent index of the `public/fedreduce` trees of every datasite.
+
+    Each directory is stored with its mtime and listing. A refresh still stats
+    every directory but only lists the ones whose mtime changed, so unchanged
+    subtrees cost one `stat` each instead of a full glob.
+    """
+
+    def __init__(self, root, filename="./index.json"):
+        self.root = Path(root)
+        self.filename = filename
+        self.dirs = {}
+        self.entries = []
+        self.dirty = False
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.filename):
+            return
+        try:
+            with open(self.filename, "r") as file:
+                data = json.load(file)
+        except (json.JSONDecodeError, OSError):
+            return
+        if data.get("root") != str(self.root):
+            return
+        self.dirs = data.get("dirs", {})
+        self._build_entries()
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp_path = f"{self.filename}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({"root": str(self.root), "dirs": self.dirs}, file)
+        os.replace(tmp_path, self.filename)
+        self.dirty = False
+
+    def _scan(self, rel, old_dirs, new_dirs, scan_start_ns) -> bool:
+        """Refresh `rel` and everything below it. Returns True if a listing
+        changed anywhere in the subtree."""
+        path = self.root / rel if rel else self.root
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except (FileNotFoundError, NotADirectoryError):
+            return rel in old_dirs
+
+        cached = old_dirs.get(rel)
+        changed = False
+        if (
+            cached is not None
+            and cached["mtime_ns"] == mtime_ns
+            and mtime_ns < scan_start_ns - RACY_WINDOW_NS
+        ):
+            files, subdirs = cached["files"], cached["dirs"]
+        else:
+            files, subdirs = [], []
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.name)
+                        else:
+                            files.append(entry.name)
+            except (FileNotFoundError, NotADirectoryError):
+                return rel in old_dirs
+            files.sort()
+            subdirs.sort()
+            changed = (
+                cached is None or cached["files"] != files or cached["dirs"] != subdirs
+            )
+
+        new_dirs[rel] = {"mtime_ns": mtime_ns, "files": files, "dirs": subdirs}
+
+        if rel == "":
+            # datasites root, only descend into each public fedreduce folder
+            children = [f"{name}/public/{APP_NAME}" for name in subdirs if "@" in name]
+        else:
+            children = [f"{rel}/{name}" for name in subdirs]
+
+        for child in children:
+            if self._scan(child, old_dirs, new_dirs, scan_start_ns):
+                changed = True
+        return changed
+
+    def refresh(self) -> bool:
+        """Bring the index up to date with the filesystem. Returns True if
+        anything changed since the last refresh."""
+        old_dirs = self.dirs
+        new_dirs = {}
+        changed = self._scan("", old_dirs, new_dirs, time.time_ns())
+        # catch subtrees that disappeared entirely
+        changed = changed or set(old_dirs) != set(new_dirs)
+        self.dirs = new_dirs
+        if changed:
+            self._build_entries()
+        self.dirty = self.dirty or old_dirs != new_dirs
+        return changed
+
+    def _build_entries(self):
+        entries = []
+        for rel, listing in self.dirs.items():
+            if not rel:
+                continue
+            parts = rel.split("/")
+            # <datasite>/public/fedreduce[/...]
+            if len(parts) < 3:
+                continue
+            datasite = parts[0]
+            for file_name in listing["files"]:
+                entry = classify(datasite, parts[3:] + [file_name])
+                entry["path"] = f"{rel}/{file_name}"
+                entries.append(entry)
+        entries.sort(key=lambda entry: entry["path"])
+        self.entries = entries
+
+    def query(
+        self,
+        state: Optional[str] = None,
+        author: Optional[str] = None,
+        project: Optional[str] = None,
+        kind: Optional[str] = None,
+        datasite: Optional[str] = None,
+    ) -> List[Dict[str, Optional[str]]]:
+        """Return index entries matching every filter that is not None."""
+        filters = {
+            "state": state,
+            "author": author,
+            "project": project,
+            "kind": kind,
+            "datasite": datasite,
+        }
+        filters = {key: value for key, value in filters.items() if value is not None}
+        return [
+            entry
+            for entry in self.entries
+            if all(entry[key] == value for key, value in filters.items())
+        ]
+
+    def glob(self, **filters) -> List[Tuple[str, Path]]:
+        """Drop-in replacement for `datasites_file_glob` results."""
+        return [
+            (entry["datasite"], self.root / entry["path"])
+            for entry in self.query(**filters)
+        ]
+
+
+def load_index(client, filename="./index.json") -> ProjectIndex:
+    """Load the persisted index for this client and bring it up to date."""
+    index = ProjectIndex(datasites_path(client), filename=filename)
+    index.refresh()
+    return index
@@ -0,0 +1,126 @@
+"""Moves projects between lifecycle states with renames instead of copies.
+
+A transition is a short list of operations, recorded in the project's state
+before any of them runs:
+
+    ["move", src, dst]   rename a file or folder of ours into place
+    ["link", src, dst]   snapshot a folder someone else owns, such as the
+                         author's project code, as hardlinks
+
+If the app stops half way, the next tick finds the pending record and runs
+the same operations again, each of which is safe to repeat. The join marker
+goes last, since where it is decides the state `run_projects` sees.
+"""
+
+import os
+import shutil
+from typing import List, Optional, Sequence
+
+MOVE = "move"
+LINK = "link"
+
+
+def link_tree(src, dst):
+    """Recreates `src` at `dst` with hardlinks, copying the files that can't
+    be linked, e.g. on another filesystem. Sync replaces files rather than
+    rewriting them, so the links keep the version they were made from."""
+    for root, _, files in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(target, exist_ok=True)
+        for name in files:
+            source = os.path.join(root, name)
+            destination = os.path.join(target, name)
+            try:
+                os.link(source, destination)
+            except OSError:
+                shutil.copy2(source, destination)
+
+
+def remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.unlink(path)
+
+
+def snapshot_tree(src, dst):
+    """Links `src` into a temporary folder next to `dst`, then renames it
+    into place, so `dst` never shows a partial tree."""
+    tmp_path = f"{dst}.linking"
+    remove(tmp_path)
+    link_tree(src, tmp_path)
+    remove(dst)
+    os.replace(tmp_path, dst)
+
+
+def move_path(src, dst):
+    """Renames `src` to `dst`, replacing whatever is there. When a rename
+    isn't possible, e.g. across filesystems, `dst` is built from hardlinks or
+    copies and `src` removed."""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.isdir(dst) and not os.path.samefile(src, dst):
+        shutil.rmtree(dst)
+    try:
+        os.replace(src, dst)
+        return
+    except OSError:
+        pass
+    if os.path.isdir(src):
+        snapshot_tree(src, dst)
+    else:
+        tmp_path = f"{dst}.linking"
+        remove(tmp_path)
+        try:
+            os.link(src, tmp_path)
+        except OSError:
+            shutil.copy2(src, tmp_path)
+        os.replace(tmp_path, dst)
+    remove(src)
+
+
+def run_operations(operations: Sequence[Sequence[str]]):
+    for operation, src, dst in operations:
+        if not os.path.lexists(src):
+            # already done before an interruption
+            continue
+        if operation == MOVE:
+            move_path(src, dst)
+        elif operation == LINK:
+            snapshot_tree(src, dst)
+        else:
+            raise ValueError(f"Unknown lifecycle operation: {operation}")
+
+
+def remove_empty_dirs(paths):
+    """Drops folders a transition moved the last file out of, such as
+    `join/<author>`."""
+    for path in paths:
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass
+
+
+def transition(state, to_state: str, operations: List[List[str]]):
+    """Records the transition in `state`, then runs it."""
+    state.set_lifecycle(to_state, pending=operations)
+    finish_transition(state)
+
+
+def finish_transition(state) -> Optional[str]:
+    """Completes a pending transition. Returns the state it moved the
+    project to, None if nothing was pending."""
+    lifecycle = state.lifecycle()
+    pending = lifecycle.get("pending")
+    if not pending:
+        return None
+    run_operations(pending)
+    remove_empty_dirs(
+        {
+            os.path.dirname(src)
+            for operation, src, dst in pending
+            if operation == MOVE and os.path.isfile(dst)
+        }
+    )
+    state.set_lifecycle(lifecycle["state"])
+    return lifecycle["state"]
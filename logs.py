@@ -0,0 +1,316 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import List
+
+# a log is written as numbered append-only segments next to an index:
+#   <name>.yaml.log.000001, <name>.yaml.log.000002, ...
+#   <name>.yaml.log.index.json   byte offsets of each segment and a summary
+# a segment is sealed once it reaches SEGMENT_BYTES and never changes again
+SEGMENT_BYTES = 256 * 1024
+MAX_SEGMENTS = 16
+INDEX_SUFFIX = ".index.json"
+# open log files kept around, the least recently written is closed first
+MAX_OPEN_LOGS = 32
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        log_record = {
+            "timestamp": datetime.utcfromtimestamp(record.created).isoformat(),
+            "message": record.getMessage(),
+        }
+        # structured fields passed with `extra`, like a step's timings
+        for key in ("step", "metrics"):
+            value = getattr(record, key, None)
+            if value is not None:
+                log_record[key] = value
+        return json.dumps(log_record)
+
+
+def index_path(log_file) -> str:
+    return f"{log_file}{INDEX_SUFFIX}"
+
+
+def log_files(log_file) -> List[str]:
+    """Every file that belongs to a log: its segments, its index and the
+    single file older versions wrote."""
+    directory, name = os.path.split(str(log_file))
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        os.path.join(directory, file_name)
+        for file_name in os.listdir(directory)
+        if file_name == name or file_name.startswith(f"{name}.")
+    )
+
+
+class SegmentedLogHandler(logging.Handler):
+    """Appends JSON lines to numbered segments and keeps an index of where
+    each segment starts, so readers only fetch what they haven't seen.
+
+    Offsets count bytes since the log was created and survive old segments
+    being deleted. The index also holds a summary of the log: line and error
+    counts, the last step and the last error.
+    """
+
+    def __init__(
+        self, log_file, segment_bytes=SEGMENT_BYTES, max_segments=MAX_SEGMENTS
+    ):
+        super().__init__()
+        self.log_file = str(log_file)
+        self.index_path = index_path(self.log_file)
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.stream = None
+        self.dirty = False
+        self.index = self._load_index()
+
+    def _load_index(self):
+        index = None
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r") as file:
+                    index = json.load(file)
+            except (OSError, json.JSONDecodeError):
+                index = None
+        if index is None:
+            return {"version": 1, "size": 0, "segments": [], "summary": {}}
+
+        # lines written after the index was last saved still count
+        if index["segments"]:
+            last = index["segments"][-1]
+            path = self.segment_path(last["number"])
+            length = os.path.getsize(path) if os.path.exists(path) else 0
+            if length != last["length"]:
+                index["size"] += length - last["length"]
+                last["length"] = length
+                self.dirty = True
+        return index
+
+    def segment_path(self, number) -> str:
+        return f"{self.log_file}.{number:06d}"
+
+    def _open_segment(self):
+        segments = self.index["segments"]
+        if segments and segments[-1]["length"] < self.segment_bytes:
+            segment = segments[-1]
+        else:
+            number = segments[-1]["number"] + 1 if segments else 1
+            segment = {
+                "number": number,
+                "name": os.path.basename(self.segment_path(number)),
+                "offset": self.index["size"],
+                "length": 0,
+                "lines": 0,
+            }
+            segments.append(segment)
+            while len(segments) > self.max_segments:
+                oldest = segments.pop(0)
+                try:
+                    os.unlink(self.segment_path(oldest["number"]))
+                except FileNotFoundError:
+                    pass
+        self.stream = open(self.segment_path(segment["number"]), "ab")
+        return segment
+
+    def emit(self, record):
+        try:
+            line = (self.format(record) + "\n").encode()
+            segment = self.index["segments"][-1] if self.stream else None
+            if segment is None or segment["length"] >= self.segment_bytes:
+                if self.stream is not None:
+                    self.stream.close()
+                segment = self._open_segment()
+            self.stream.write(line)
+            self.stream.flush()
+
+            segment["length"] += len(line)
+            segment["lines"] += 1
+            self.index["size"] += len(line)
+            self._summarize(record)
+            self.dirty = True
+        except Exception:
+            self.handleError(record)
+
+    def _summarize(self, record):
+        summary = self.index["summary"]
+        message = record.getMessage()
+        summary["lines"] = summary.get("lines", 0) + 1
+        summary["updated"] = record.created
+        summary["last_message"] = message
+        step = getattr(record, "step", None)
+        if step is not None:
+            summary["last_step"] = step
+        if record.levelno >= logging.ERROR:
+            summary["errors"] = summary.get("errors", 0) + 1
+            summary["last_error"] = message
+            summary["last_error_at"] = record.created
+
+    def save_index(self):
+        if not self.dirty:
+            return
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(self.index, file, separators=(",", ":"))
+        os.replace(tmp_path, self.index_path)
+        self.dirty = False
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        self.save_index()
+        super().close()
+
+
+class ProjectQueueHandler(logging.handlers.QueueHandler):
+    """Puts records on the shared queue, tagged with their project's log file."""
+
+    def __init__(self, log_queue, log_file):
+        super().__init__(log_queue)
+        self.log_file = log_file
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.log_file = self.log_file
+        return record
+
+
+class LogFileRouter(logging.Handler):
+    """Writes each record to its project's log, through one segmented handler
+    per log. Only the listener thread calls it.
+
+    Indexes are saved whenever the queue runs empty, so a burst of records
+    costs one index write.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__()
+        self.log_queue = log_queue
+        self.handlers = OrderedDict()
+        self.formatter = JsonFormatter()
+
+    def handler_for(self, log_file):
+        handler = self.handlers.get(log_file)
+        if handler is None:
+            handler = SegmentedLogHandler(log_file)
+            handler.setFormatter(self.formatter)
+            self.handlers[log_file] = handler
+            while len(self.handlers) > MAX_OPEN_LOGS:
+                _, oldest = self.handlers.popitem(last=False)
+                oldest.close()
+        else:
+            self.handlers.move_to_end(log_file)
+        return handler
+
+    def emit(self, record):
+        done = getattr(record, "flushed", None)
+        if done is not None:
+            handler = self.handlers.pop(getattr(record, "release", None), None)
+            if handler is not None:
+                handler.close()
+            self.save_indexes()
+            done.set()
+            return
+
+        log_file = getattr(record, "log_file", None)
+        if log_file is None:
+            return
+        try:
+            self.handler_for(log_file).handle(record)
+        except Exception:
+            self.handleError(record)
+        if self.log_queue.empty():
+            self.save_indexes()
+
+    def save_indexes(self):
+        for handler in self.handlers.values():
+            try:
+                handler.save_index()
+            except OSError:
+                pass
+
+    def close(self):
+        for handler in self.handlers.values():
+            handler.close()
+        self.handlers.clear()
+        super().close()
+
+
+def is_log_record(record) -> bool:
+    return not hasattr(record, "flushed")
+
+
+_lock = threading.Lock()
+_queue = None
+_listener = None
+_router = None
+
+
+def _start_listener():
+    global _queue, _listener, _router
+    if _queue is None:
+        _queue = queue.SimpleQueue()
+        atexit.register(stop_logging)
+    _router = LogFileRouter(_queue)
+    console_handler = logging.StreamHandler()
+    console_handler.addFilter(is_log_record)
+    console_handler.setFormatter(
+        logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    )
+    _listener = logging.handlers.QueueListener(_queue, console_handler, _router)
+    _listener.start()
+
+
+def setup_logger(log_file) -> logging.Logger:
+    """The logger for one project's log file.
+
+    Calling it again for the same file returns the same logger without adding
+    handlers. Loggers only enqueue records: a single background listener
+    formats them and writes to the console and to the project's segmented
+    JSON-lines log.
+    """
+    log_file = str(log_file)
+    logger = logging.getLogger(f"pipeline_logger.{log_file}")
+    if logger.handlers and _listener is not None:
+        return logger
+    with _lock:
+        if _listener is None:
+            _start_listener()
+        if logger.handlers:
+            return logger
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+        logger.addHandler(ProjectQueueHandler(_queue, log_file))
+    return logger
+
+
+def flush_logs(release=None, timeout=5.0) -> bool:
+    """Waits until everything logged so far is written and every index saved.
+
+    With `release`, that log's files are also closed, e.g. before moving them.
+    """
+    if _listener is None:
+        return True
+    record = logging.makeLogRecord({"flushed": threading.Event()})
+    record.release = str(release) if release is not None else None
+    _queue.put(record)
+    return record.flushed.wait(timeout)
+
+
+def stop_logging():
+    """Writes out everything still queued and closes the log files."""
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _router.close()
+        _listener = None
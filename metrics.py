@@ -0,0 +1,229 @@
+"""Per-step timings and byte counts, aggregated per project.
+
+Every step run records how long it waited for its inputs and spent reading,
+computing, writing and applying permissions, plus the bytes it read and
+wrote. A datasite keeps its steps of a project in a metrics file next to the
+project log, `<project>.yaml.metrics.json`, with the same numbers in
+Prometheus text format in `<project>.yaml.metrics.prom`. Both sit in the
+public folder, so the author can follow the critical path across datasites.
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+from sdk import write_atomic
+
+PHASES = ("wait", "read", "compute", "write", "permissions")
+METRICS_SUFFIX = ".metrics.json"
+PROMETHEUS_SUFFIX = ".metrics.prom"
+
+
+def metrics_path(log_file) -> str:
+    """`<project>.yaml.log` -> `<project>.yaml.metrics.json`"""
+    base = str(log_file)
+    if base.endswith(".log"):
+        base = base[: -len(".log")]
+    return f"{base}{METRICS_SUFFIX}"
+
+
+def prometheus_path(metrics_file) -> str:
+    return f"{str(metrics_file)[: -len(METRICS_SUFFIX)]}{PROMETHEUS_SUFFIX}"
+
+
+def metrics_files(log_file) -> List[str]:
+    """The metrics files that exist for a project log."""
+    json_file = metrics_path(log_file)
+    paths = [json_file, prometheus_path(json_file)]
+    return [path for path in paths if os.path.exists(path)]
+
+
+class StepTimer:
+    """Timed phases and byte counts of one step run."""
+
+    def __init__(self, wait: float = 0.0):
+        self.started = time.time()
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.phases["wait"] = wait
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    @contextmanager
+    def span(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[phase] += time.perf_counter() - start
+
+    def as_dict(self) -> Dict:
+        phases = {phase: round(seconds, 6) for phase, seconds in self.phases.items()}
+        return {
+            "started": self.started,
+            "finished": time.time(),
+            **phases,
+            "total": round(sum(self.phases.values()), 6),
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+        }
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class ProjectMetrics:
+    """The latest run of each of this datasite's steps of one project."""
+
+    def __init__(self, filename, author, project, datasite):
+        self.filename = str(filename)
+        self.data = self._load()
+        self.data.update(author=author, project=project, datasite=datasite)
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.filename, "r") as file:
+                return json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return {"version": 1, "steps": {}}
+
+    def record(self, step_num, step_metrics: Dict):
+        self.data["steps"][str(step_num)] = step_metrics
+        self.save()
+
+    def totals(self) -> Dict:
+        steps = self.data["steps"].values()
+        totals = {
+            key: round(sum(step.get(key, 0) for step in steps), 6)
+            for key in (*PHASES, "total", "bytes_read", "bytes_written")
+        }
+        totals["steps"] = len(steps)
+        return totals
+
+    def to_prometheus(self) -> str:
+        labels = ",".join(
+            f'{key}="{escape_label(self.data[key])}"'
+            for key in ("author", "project", "datasite")
+        )
+        lines = [
+            "# HELP fedreduce_step_seconds Seconds a step spent in each phase.",
+            "# TYPE fedreduce_step_seconds gauge",
+        ]
+        for step_num, step in sorted(self.data["steps"].items()):
+            for phase in PHASES:
+                lines.append(
+                    f'fedreduce_step_seconds{{{labels},step="{escape_label(step_num)}",'
+                    f'phase="{phase}"}} {step.get(phase, 0)}'
+                )
+        lines += [
+            "# HELP fedreduce_step_bytes Bytes a step read and wrote.",
+            "# TYPE fedreduce_step_bytes gauge",
+        ]
+        for step_num, step in sorted(self.data["steps"].items()):
+            for direction in ("read", "written"):
+                lines.append(
+                    f'fedreduce_step_bytes{{{labels},step="{escape_label(step_num)}",'
+                    f'direction="{direction}"}} {step.get(f"bytes_{direction}", 0)}'
+                )
+        lines += [
+            "# HELP fedreduce_project_seconds Seconds all steps spent in each phase.",
+            "# TYPE fedreduce_project_seconds gauge",
+        ]
+        totals = self.totals()
+        for phase in PHASES:
+            lines.append(
+                f'fedreduce_project_seconds{{{labels},phase="{phase}"}} {totals[phase]}'
+            )
+        return "\n".join(lines) + "\n"
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.filename) or ".", exist_ok=True)
+        self.data["totals"] = self.totals()
+        self.data["updated"] = time.time()
+        write_atomic(self.filename, json.dumps(self.data, indent=2).encode())
+        write_atomic(prometheus_path(self.filename), self.to_prometheus().encode())
+
+
+def load_metrics(paths: Iterable) -> List[Dict]:
+    documents = []
+    for path in paths:
+        try:
+            with open(path, "r") as file:
+                documents.append(json.load(file))
+        except (OSError, json.JSONDecodeError):
+            continue
+    return documents
+
+
+def valid_step(step) -> bool:
+    """Whether a step from a metrics file has every number we add up."""
+    if not isinstance(step, dict):
+        return False
+    keys = (*PHASES, "started", "finished", "bytes_read", "bytes_written")
+    return all(
+        isinstance(step.get(key), (int, float)) and not isinstance(step[key], bool)
+        for key in keys
+    ) and isinstance(step.get("depends_on", []), list)
+
+
+def critical_path(documents: Iterable[Dict]) -> Optional[Dict]:
+    """The chain of steps that decided when a project finished.
+
+    Starts at the step that finished last and follows, at each step, the
+    input step that finished last, since that is the one the step waited
+    for. Sums each phase along the chain. Steps wait side by side, so past
+    the first step only the wait after its input step finished is counted,
+    which is the time the input took to arrive.
+    """
+    steps = {}
+    for document in documents:
+        if not isinstance(document, dict) or not isinstance(
+            document.get("steps"), dict
+        ):
+            continue
+        for step_num, step in document["steps"].items():
+            # other datasites write these files, skip steps that are malformed
+            if valid_step(step):
+                steps[str(step_num)] = {**step, "datasite": document.get("datasite")}
+    if not steps:
+        return None
+
+    def finished(step_num):
+        return steps[step_num]["finished"]
+
+    path = []
+    current = max(steps, key=finished)
+    while current is not None and current not in path:
+        path.append(current)
+        inputs = [
+            str(step_num)
+            for step_num in steps[current].get("depends_on", [])
+            if str(step_num) in steps
+        ]
+        current = max(inputs, key=finished) if inputs else None
+    path.reverse()
+
+    breakdown = dict.fromkeys(PHASES, 0.0)
+    previous = None
+    for step_num in path:
+        step = steps[step_num]
+        for phase in PHASES:
+            breakdown[phase] += step[phase]
+        if previous is not None:
+            arrival = max(step["started"] - previous["finished"], 0)
+            breakdown["wait"] += arrival - step["wait"]
+        previous = step
+
+    first, last = steps[path[0]], steps[path[-1]]
+    return {
+        "seconds": round(last["finished"] - first["started"] + first["wait"], 6),
+        "breakdown": {phase: round(seconds, 6) for phase, seconds in breakdown.items()},
+        "steps": [
+            {"step": step_num, "datasite": steps[step_num]["datasite"]}
+            for step_num in path
+        ],
+        "bytes_read": sum(step["bytes_read"] for step in steps.values()),
+        "bytes_written": sum(step["bytes_written"] for step in steps.values()),
+    }
@@ -0,0 +1,113 @@
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+DEFAULT_STATE_FILE = "./permissions.json"
+# the file SyftPermission.ensure writes into a folder
+PERMISSION_FILE = "_.syftperm"
+ACCESS = ("admin", "read", "write")
+
+
+def describe(permission) -> Dict:
+    """The access a permission grants, comparable between ticks."""
+    return {key: sorted(set(getattr(permission, key, None) or [])) for key in ACCESS}
+
+
+def file_signature(folder) -> Optional[list]:
+    try:
+        stat = os.stat(os.path.join(folder, PERMISSION_FILE))
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class PermissionManager:
+    """Applies folder permissions only when they change.
+
+    Grants are queued and applied together by `apply()`, once for all the
+    outputs of a tick. Each folder's last applied access and the size and
+    mtime of its permission file are persisted, so a grant that matches what
+    is already on disk costs a `stat` instead of a rewrite that every peer
+    would sync. A permission file that was changed or deleted behind our
+    back is written again.
+    """
+
+    def __init__(self, filename=DEFAULT_STATE_FILE):
+        self.filename = filename
+        self.applied = self._load()
+        self.pending = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.skips = 0
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.filename, "r") as file:
+                return json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def grant(self, folder, permission):
+        """Queues `permission` for `folder`. Grants for the same folder in one
+        batch are merged, so every output in it stays accessible."""
+        folder = os.path.abspath(str(folder))
+        with self.lock:
+            queued = self.pending.get(folder)
+            if queued is not None:
+                for key in ACCESS:
+                    merged = set(getattr(queued, key)) | set(getattr(permission, key))
+                    setattr(queued, key, sorted(merged))
+            else:
+                self.pending[folder] = permission
+
+    def apply(self) -> int:
+        """Writes the queued permissions that differ from what was last
+        applied. Returns how many permission files were written."""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            written = 0
+            for folder, permission in pending.items():
+                access = describe(permission)
+                applied = self.applied.get(folder)
+                if (
+                    applied is not None
+                    and applied["access"] == access
+                    and applied["signature"] == file_signature(folder)
+                ):
+                    self.skips += 1
+                    continue
+                permission.ensure(folder)
+                self.applied[folder] = {
+                    "access": access,
+                    "signature": file_signature(folder),
+                }
+                self.dirty = True
+                written += 1
+            self.writes += written
+            self.save()
+            return written
+
+    def save(self):
+        if not self.dirty:
+            return
+        # folders that went away, e.g. projects moved to complete
+        for folder in [folder for folder in self.applied if not os.path.isdir(folder)]:
+            del self.applied[folder]
+        tmp_path = f"{self.filename}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(self.applied, file, separators=(",", ":"))
+        os.replace(tmp_path, self.filename)
+        self.dirty = False
+
+
+_manager: Optional[PermissionManager] = None
+
+
+def get_permission_manager() -> PermissionManager:
+    """Process-wide manager shared by app.py and run.py."""
+    global _manager
+    if _manager is None:
+        _manager = PermissionManager()
+    return _manager
@@ -0,0 +1,129 @@
+"""Built-in reducers.
+
+Each takes the step's input values positionally and works the same on plain
+numbers and NumPy arrays. Arrays are combined with in-place ufuncs into a
+single output buffer, so there is no per-element Python work and no
+temporary per input.
+"""
+
+from typing import Optional, Sequence
+
+
+def is_array(value) -> bool:
+    return hasattr(value, "__array__")
+
+
+def _accumulate(ufunc, values, dtype=None):
+    import numpy as np
+
+    shape = np.broadcast_shapes(*(np.shape(value) for value in values))
+    if dtype is None:
+        dtype = np.result_type(*values)
+    result = np.empty(shape, dtype=dtype)
+    result[...] = values[0]
+    for value in values[1:]:
+        ufunc(result, value, out=result)
+    return result
+
+
+def reduce_sum(*values):
+    """Element-wise sum of all values."""
+    if not any(is_array(value) for value in values):
+        return sum(values)
+
+    import numpy as np
+
+    return _accumulate(np.add, values)
+
+
+def mean(*values):
+    """Element-wise mean of all values."""
+    if not any(is_array(value) for value in values):
+        return sum(values) / len(values)
+
+    import numpy as np
+
+    result = _accumulate(np.add, values, dtype=np.result_type(*values, 1.0))
+    result /= len(values)
+    return result
+
+
+def weighted_mean(*values, weights: Optional[Sequence[float]] = None):
+    """Element-wise mean with one weight per value, e.g. dataset sizes.
+
+    Weights come from the step's `options`, equal weights are used if missing.
+    """
+    if weights is None:
+        weights = [1.0] * len(values)
+    if len(weights) != len(values):
+        raise ValueError(f"Expected {len(values)} weights, got {len(weights)}.")
+    total = float(sum(weights))
+
+    if not any(is_array(value) for value in values):
+        return sum(value * weight for value, weight in zip(values, weights)) / total
+
+    import numpy as np
+
+    shape = np.broadcast_shapes(*(np.shape(value) for value in values))
+    dtype = np.result_type(*values, 1.0)
+    result = np.zeros(shape, dtype=dtype)
+    scratch = np.empty(shape, dtype=dtype)
+    for value, weight in zip(values, weights):
+        np.multiply(value, weight, out=scratch)
+        np.add(result, scratch, out=result)
+    result /= total
+    return result
+
+
+def minimum(*values):
+    """Element-wise minimum of all values."""
+    if not any(is_array(value) for value in values):
+        return min(values)
+
+    import numpy as np
+
+    return _accumulate(np.minimum, values)
+
+
+def maximum(*values):
+    """Element-wise maximum of all values."""
+    if not any(is_array(value) for value in values):
+        return max(values)
+
+    import numpy as np
+
+    return _accumulate(np.maximum, values)
+
+
+def merge_histograms(*values):
+    """Adds up histogram counts, which must all use the same bins."""
+    import numpy as np
+
+    shapes = {np.shape(value) for value in values if np.ndim(value) > 0}
+    if len(shapes) > 1:
+        raise ValueError(f"Histograms have different bins: {sorted(shapes)}")
+    return reduce_sum(*values)
+
+
+def count(*values):
+    """How many values are present, element-wise for arrays, where missing
+    means None or NaN."""
+    if not any(is_array(value) for value in values):
+        return sum(1 for value in values if value is not None and value == value)
+
+    import numpy as np
+
+    present = [~np.isnan(value) for value in values if value is not None]
+    return _accumulate(np.add, present, dtype=np.int64)
+
+
+BUILTINS = {
+    "add": reduce_sum,
+    "sum": reduce_sum,
+    "mean": mean,
+    "weighted_mean": weighted_mean,
+    "min": minimum,
+    "max": maximum,
+    "histogram": merge_histograms,
+    "count": count,
+}
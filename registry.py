@@ -0,0 +1,117 @@
+import functools
+import hashlib
+import importlib.util
+import inspect
+import os
+from typing import Callable, Dict, List, Optional
+
+from reducers import BUILTINS
+
+# project code modules by the hash of their source, so every step and every
+# tick in this process shares one import per version of a project's code
+_module_cache: Dict[str, List] = {}
+
+
+def code_files(project_path, pipeline) -> List[str]:
+    """The Python files a project declares under `code:`."""
+    if project_path is None:
+        return []
+    return [
+        os.path.join(project_path, name)
+        for name in pipeline.get("code", []) or []
+        if name.endswith(".py")
+    ]
+
+
+def code_hash(paths) -> str:
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def load_modules(paths) -> List:
+    """Imports each code file once per version of its contents."""
+    paths = [path for path in paths if os.path.exists(path)]
+    if not paths:
+        return []
+    key = code_hash(paths)
+    if key not in _module_cache:
+        modules = []
+        for path in paths:
+            name = f"fedreduce_code_{key[:12]}_{len(modules)}"
+            spec = importlib.util.spec_from_file_location(name, path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            modules.append(module)
+        _module_cache[key] = modules
+    return _module_cache[key]
+
+
+def adapt(function: Callable) -> Callable:
+    """Wraps a project function so it can be called with any number of
+    values. Binary functions like `add(x, y)` are folded over the values, a
+    single value, e.g. the reduce of a one-participant project, is returned
+    as it is."""
+    try:
+        parameters = inspect.signature(function).parameters.values()
+    except (TypeError, ValueError):
+        return function
+    if any(param.kind == param.VAR_POSITIONAL for param in parameters):
+        return function
+    positional = [
+        param
+        for param in parameters
+        if param.kind in (param.POSITIONAL_ONLY, param.POSITIONAL_OR_KEYWORD)
+    ]
+
+    binary = len(positional) == 2
+    # a second argument with a default means it can also take one value
+    takes_one = binary and positional[1].default is not positional[1].empty
+
+    @functools.wraps(function)
+    def call(*values, **options):
+        if not binary or len(values) == 2 or (len(values) == 1 and takes_one):
+            return function(*values, **options)
+        if not values:
+            raise ValueError(f"{function.__name__}() needs at least one value.")
+        if len(values) == 1:
+            return values[0]
+        return functools.reduce(
+            lambda x, y: function(x, y, **options), values[1:], values[0]
+        )
+
+    return call
+
+
+class FunctionRegistry:
+    """Resolves a step's `function:` name to a callable.
+
+    Functions defined in the project's code files come first, then the
+    built-in reducers. Every callable takes the input values positionally and
+    the step's `options` as keyword arguments.
+    """
+
+    def __init__(self, modules: Optional[List] = None):
+        self.modules = modules or []
+        self._resolved: Dict[str, Callable] = {}
+
+    @classmethod
+    def for_project(cls, project_path, pipeline) -> "FunctionRegistry":
+        return cls(load_modules(code_files(project_path, pipeline)))
+
+    def get(self, name: str) -> Callable:
+        if name not in self._resolved:
+            self._resolved[name] = self._resolve(name)
+        return self._resolved[name]
+
+    def _resolve(self, name: str) -> Callable:
+        for module in self.modules:
+            function = getattr(module, name, None)
+            if callable(function):
+                return adapt(function)
+        if name in BUILTINS:
+            return BUILTINS[name]
+        raise ValueError(f"Unknown function: {name}")
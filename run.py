@@ -2,23 +2,23 @@ import os
 import traceback
 import argparse
 import time
-import yaml
-import logging
-from typing import Tuple
+from dataclasses import dataclass, replace
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
 from syftbox.lib import Client, SyftPermission
-from sdk import StaticPipe, FilePipe
+from sdk import Pipe, StaticPipe, FilePipe, ArrayPipe, ChunkedPipe
+from yaml_cache import load_yaml  # noqa: F401
+from watch import wait_until
+from logs import setup_logger
+from metrics import ProjectMetrics, StepTimer, metrics_path
+from permissions import get_permission_manager
+from state import ProjectState, WAITING, READY, DONE, FAILED
+from registry import FunctionRegistry
 
 import copy
 import re
 
 
-# Set up logging configuration
-import os
-import json
-import logging
-from datetime import datetime
-
-
 def find_first_yaml_file(directory):
     for root, _, files in os.walk(directory):
         for file in files:
@@ -27,80 +27,45 @@ def find_first_yaml_file(directory):
     return None
 
 
-# Set up logging configuration with JSON output
-def setup_logger(log_file):
-    logger = logging.getLogger("pipeline_logger")
-    logger.setLevel(logging.DEBUG)
-
-    # Console handler for printing to stdout
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.DEBUG)
-
-    # File handler for writing to the log file in JSON format
-    file_handler = logging.FileHandler(log_file)
-    file_handler.setLevel(logging.DEBUG)
-
-    # JSON Formatter
-    class JsonFormatter(logging.Formatter):
-        def format(self, record):
-            log_record = {
-                "timestamp": datetime.utcfromtimestamp(record.created).isoformat(),
-                "message": record.getMessage(),
-            }
-            return json.dumps(log_record)
-
-    # Set the JSON formatter for file logging
-    json_formatter = JsonFormatter()
-    file_handler.setFormatter(json_formatter)
-
-    # Standard formatter for console output
-    standard_formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-    console_handler.setFormatter(standard_formatter)
-
-    # Add handlers to the logger
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
-    return logger
-
-
-def load_yaml(file_path):
-    with open(file_path, "r") as file:
-        return yaml.safe_load(file)
-
-
 def process_template(path_template, context):
     """Replaces placeholders in path templates with values from the context."""
     return path_template.format(**context)
 
 
-def add(**kwargs):
-    print("Calling add with arguments: %s", kwargs)
-    result = sum(input_pipe.read() for input_pipe in kwargs.values())
-    return result
+# pipes that read and write a file in the sync folder, by their YAML name
+PATH_PIPES = {
+    "FilePipe": FilePipe,
+    "ArrayPipe": ArrayPipe,
+    "ChunkedPipe": ChunkedPipe,
+}
 
 
 def instantiate_pipe(client, pipe_config, context):
-    """Instantiates StaticPipe or FilePipe based on YAML configuration."""
+    """Instantiates StaticPipe or a path pipe based on YAML configuration."""
     if isinstance(pipe_config, dict):
         # Unpack the nested structure for class instantiation
         if "StaticPipe" in pipe_config:
             value = pipe_config["StaticPipe"]
             return StaticPipe(value)
-        elif "FilePipe" in pipe_config:
-            value = pipe_config["FilePipe"]
-            file_path = process_template(value, context)
-            return FilePipe(client.sync_folder / file_path)
+        for pipe_name, pipe_class in PATH_PIPES.items():
+            if pipe_name in pipe_config:
+                value = pipe_config[pipe_name]
+                file_path = process_template(value, context)
+                pipe = pipe_class(client.sync_folder / file_path)
+                pipe.require_commit = pipe_config.get("require_commit", False)
+                return pipe
 
     elif isinstance(pipe_config, str):
         # Check if pipe_config is in the form "FilePipe(...)" or "StaticPipe(...)"
-        file_pipe_match = re.match(r'FilePipe\("(.+)"\)', pipe_config)
+        path_pipe_match = re.match(r'(\w+)\("(.+)"\)', pipe_config)
         static_pipe_match = re.match(r"StaticPipe\((.+)\)", pipe_config)
 
-        if file_pipe_match:
+        if path_pipe_match and path_pipe_match.group(1) in PATH_PIPES:
             # Extract the path inside the FilePipe() syntax
-            path_template = file_pipe_match.group(1)
+            pipe_class = PATH_PIPES[path_pipe_match.group(1)]
+            path_template = path_pipe_match.group(2)
             file_path = process_template(path_template, context)
-            return FilePipe(client.sync_folder / file_path)
+            return pipe_class(client.sync_folder / file_path)
 
         elif static_pipe_match:
             # Extract the value inside StaticPipe() and convert it to the correct type
@@ -119,47 +84,117 @@ def instantiate_pipe(client, pipe_config, context):
     raise ValueError(f"Invalid pipe configuration: {pipe_config}")
 
 
-def execute_step(client, step, context, logger) -> bool:
+def build_input_pipes(client, step, context):
+    """Instantiates the input pipes of a step, keyed by input name."""
+    inputs = {}
+    for input_item in step["inputs"]:
+        key, pipe_config = next(iter(input_item.items()))
+        inputs[key] = instantiate_pipe(client, pipe_config, context)
+    return inputs
+
+
+def stream_operation(function, inputs, output_pipe, options=None) -> dict:
+    """Applies `function` chunk by chunk when any input is a ChunkedPipe.
+
+    Chunked inputs must share their shape and chunk size. Scalars are passed
+    to every chunk and other arrays are sliced to match, so only one chunk of
+    each input is in memory at a time. Returns the manifest of the result.
+    """
+    import numpy as np
+
+    chunked = {
+        key: pipe for key, pipe in inputs.items() if isinstance(pipe, ChunkedPipe)
+    }
+    manifests = {key: pipe.manifest() for key, pipe in chunked.items()}
+    manifest = next(iter(manifests.values()))
+    chunk_size = manifest["chunk_size"]
+    for key, other in manifests.items():
+        if other["shape"] != manifest["shape"] or other["chunk_size"] != chunk_size:
+            raise ValueError(f"Chunked input {key} doesn't match the other inputs.")
+
+    whole_values = {
+        key: pipe.read() for key, pipe in inputs.items() if key not in chunked
+    }
+
+    def result_chunks():
+        iterators = {key: pipe.iter_chunks() for key, pipe in chunked.items()}
+        for index in range(manifest["chunks"]):
+            start, stop = index * chunk_size, (index + 1) * chunk_size
+            chunk_values = []
+            for key in inputs:
+                if key in iterators:
+                    value = next(iterators[key])
+                else:
+                    value = whole_values[key]
+                    if np.ndim(value) > 0:
+                        value = np.asarray(value).reshape(-1)[start:stop]
+                chunk_values.append(value)
+            yield function(*chunk_values, **(options or {}))
+
+    if isinstance(output_pipe, ChunkedPipe):
+        output_pipe.chunk_size = chunk_size
+        result = output_pipe.write_chunks(result_chunks(), manifest["shape"])
+    else:
+        chunks = list(result_chunks())
+        output_pipe.write(np.concatenate(chunks).reshape(manifest["shape"]))
+        result = manifest
+    # the per-chunk checksums would flood the step log
+    return {key: value for key, value in result.items() if key != "checksums"}
+
+
+def describe_result(result, limit=80) -> str:
+    """A step's result for the log: the type, shape and dtype of arrays
+    rather than their values, and short values as they are."""
+    shape = getattr(result, "shape", None)
+    if shape is not None and hasattr(result, "dtype"):
+        return f"{type(result).__name__}{list(shape)} {result.dtype}"
+    text = repr(result)
+    return text if len(text) <= limit else f"{text[: limit - 3]}..."
+
+
+def execute_step(client, step: "CompiledStep", logger, timer=None) -> bool:
+    """Runs a step whose inputs are ready, timing each phase into `timer`."""
+    if timer is None:
+        timer = StepTimer()
     try:
-        inputs = {}
-        for input_item in step["inputs"]:
-            key, pipe_config = next(iter(input_item.items()))
-            inputs[key] = instantiate_pipe(client, pipe_config, context)
-
-        if not all(pipe.ready() for pipe in inputs.values()):
-            message = f"Inputs not ready for {step}."
+        if not step.ready():
+            message = f"Inputs not ready for step {step.step_num}."
             logger.debug(message)
             return False
 
-        operation = step["function"]
-        if operation == "add":
-            result = add(**inputs)
-        print("pipe", step["output"]["path"])
-        output_pipe = instantiate_pipe(client, step["output"]["path"], context)
-        folder = os.path.dirname(output_pipe.file_path)
-        os.makedirs(folder, exist_ok=True)
-        output_pipe.write(result)
-
-        access_emails = [client.email]
-        for emails in step["output"]["permissions"].get("read", []):
-            print("email", emails, type(emails))
-            if isinstance(emails, str):
-                emails = [emails]
-
-            for email in emails:
-                access_email = process_template(email, context)
-                access_emails.append(access_email)
-
+        print("pipe", step.output.file_path)
+        os.makedirs(step.folder, exist_ok=True)
+        timer.bytes_read = sum(pipe.size() for pipe in step.inputs.values())
+        if any(isinstance(pipe, ChunkedPipe) for pipe in step.inputs.values()):
+            # chunks are read, computed and written one at a time, so the
+            # whole stream counts as compute
+            with timer.span("compute"):
+                result = stream_operation(
+                    step.function, step.inputs, step.output, step.options
+                )
+        else:
+            with timer.span("read"):
+                values = [pipe.read() for pipe in step.inputs.values()]
+            with timer.span("compute"):
+                result = step.function(*values, **step.options)
+            with timer.span("write"):
+                step.output.write(result)
+        timer.bytes_written = step.output.size()
+
+        access_emails = list(step.access_emails)
         permission = SyftPermission(
             admin=access_emails, read=access_emails, write=access_emails
         )
-        permission.ensure(folder)
+        # written with the other grants of this tick, and only if it changed
+        with timer.span("permissions"):
+            get_permission_manager().grant(step.folder, permission)
 
         logger.info(
-            "Ran operation '%s' with result %s and saved to %s",
-            operation,
-            result,
-            output_pipe.file_path,
+            "Ran operation '%s' with result %s (%d bytes) and saved to %s",
+            step.operation,
+            describe_result(result),
+            timer.bytes_written,
+            step.output.file_path,
         )
         return True
 
@@ -177,109 +212,508 @@ def get_step_by_name(steps, name):
     return None
 
 
-def run_steps_for_email(client, pipeline, log_file, timeout=10):
+def merge_first_step(step_config, first_step_config):
+    """Overrides inputs of a step with the ones from the `first` step."""
+    step_config = copy.deepcopy(step_config)
+    if first_step_config and "inputs" in first_step_config["first"]:
+        first_inputs = first_step_config["first"]["inputs"]
+        first_inputs_dict = {k: v for item in first_inputs for k, v in item.items()}
+        foreach_inputs_dict = {
+            k: v for item in step_config["inputs"] for k, v in item.items()
+        }
+        merged_inputs_dict = {**foreach_inputs_dict, **first_inputs_dict}
+        step_config["inputs"] = [{k: v} for k, v in merged_inputs_dict.items()]
+    return step_config
+
+
+def merge_last_step(step_config, last_step_config):
+    """Overrides the output of a step with the one from the `last` step."""
+    step_config = copy.deepcopy(step_config)
+    if last_step_config and "output" in last_step_config["last"]:
+        last_output_dict = dict(last_step_config["last"]["output"].items())
+        step_config["output"] = {**step_config["output"], **last_output_dict}
+    return step_config
+
+
+def pipe_template(pipe_config):
+    """The path template inside a pipe config, if it has one."""
+    if isinstance(pipe_config, dict):
+        return next(iter(pipe_config.values()), None)
+    return pipe_config
+
+
+def is_chained_input(pipe_config) -> bool:
+    """Inputs that read the partial result of another step."""
+    template = pipe_template(pipe_config)
+    return isinstance(template, str) and "{prev_" in template
+
+
+def bind_template(pipe_config, values):
+    """Fills in some placeholders of a pipe config, leaving the rest to the
+    step context."""
+
+    def bind(template):
+        if not isinstance(template, str):
+            return template
+        for key, value in values.items():
+            template = template.replace(f"{{{key}}}", str(value))
+        return template
+
+    if isinstance(pipe_config, dict):
+        return {key: bind(value) for key, value in pipe_config.items()}
+    return bind(pipe_config)
+
+
+def committed(pipe_config):
+    """Marks an input written by another step, so it is only ready once its
+    commit record has arrived."""
+    if isinstance(pipe_config, str):
+        path_pipe_match = re.match(r'(\w+)\("(.+)"\)', pipe_config)
+        if not path_pipe_match or path_pipe_match.group(1) not in PATH_PIPES:
+            return pipe_config
+        pipe_config = {path_pipe_match.group(1): path_pipe_match.group(2)}
+    if not isinstance(pipe_config, dict):
+        return pipe_config
+    return {**pipe_config, "require_commit": True}
+
+
+def bind_previous(pipe_config, prev_datasite, prev_step):
+    """Points a chained input at one specific previous step."""
+    return bind_template(
+        pipe_config, {"prev_datasite": prev_datasite, "prev_step": prev_step}
+    )
+
+
+def ring_plan(pipeline):
+    """Each datasite waits on the previous one, `first` starts the chain and
+    `last` writes the result."""
+    datasites = pipeline["workflow"]["datasites"]
+    steps = pipeline["steps"]
+    first_step_config = get_step_by_name(steps, "first")
+    foreach_step_config = get_step_by_name(steps, "foreach")
+    last_step_config = get_step_by_name(steps, "last")
+
+    planned_steps = []
+    for step_num, datasite in enumerate(datasites):
+        context = {
+            "author": pipeline["author"],
+            "datasite": datasite,
+            "project": pipeline["project"],
+            "step": step_num,
+            "prev_step": step_num - 1 if step_num > 0 else len(datasites) - 1,
+            "next_step": (step_num + 1) % len(datasites),
+            "prev_datasite": datasites[step_num - 1] if step_num > 0 else datasites[-1],
+            "next_datasite": datasites[(step_num + 1) % len(datasites)],
+        }
+
+        step_config = copy.deepcopy(foreach_step_config)
+        step_config["inputs"] = [
+            {key: committed(value) if is_chained_input(value) else value}
+            for item in step_config["inputs"]
+            for key, value in item.items()
+        ]
+        if step_num == 0:
+            step_config = merge_first_step(step_config, first_step_config)
+        if step_num == len(datasites) - 1:
+            step_config = merge_last_step(step_config, last_step_config)
+        planned_steps.append((step_num, datasite, step_config, context))
+    return planned_steps
+
+
+def tree_children(step_num, count, fan_in):
+    first_child = step_num * fan_in + 1
+    return list(range(first_child, min(first_child + fan_in, count)))
+
+
+def tree_plan(pipeline):
+    """Combines partial results in a reduction tree.
+
+    Datasites are laid out as a `fan_in`-ary heap: step i waits on the outputs
+    of steps i*fan_in+1 .. i*fan_in+fan_in, adds its own inputs and passes the
+    partial result to its parent. Leaves start from the `first` inputs and the
+    root (step 0) writes the `last` output, so the critical path is
+    log_fan_in(len(datasites)) hops instead of len(datasites).
+    """
+    workflow = pipeline["workflow"]
+    datasites = workflow["datasites"]
+    fan_in = max(int(workflow.get("fan_in", 2)), 2)
+    steps = pipeline["steps"]
+    first_step_config = get_step_by_name(steps, "first")
+    foreach_step_config = get_step_by_name(steps, "foreach")
+    last_step_config = get_step_by_name(steps, "last")
+
+    planned_steps = []
+    for step_num, datasite in enumerate(datasites):
+        parent = (step_num - 1) // fan_in if step_num > 0 else None
+        children = tree_children(step_num, len(datasites), fan_in)
+        context = {
+            "author": pipeline["author"],
+            "datasite": datasite,
+            "project": pipeline["project"],
+            "step": step_num,
+            "next_step": parent if parent is not None else step_num,
+            "next_datasite": (
+                datasites[parent] if parent is not None else pipeline["author"]
+            ),
+        }
+
+        if children:
+            step_config = copy.deepcopy(foreach_step_config)
+            inputs = []
+            for item in step_config["inputs"]:
+                key, pipe_config = next(iter(item.items()))
+                if not is_chained_input(pipe_config):
+                    inputs.append(item)
+                    continue
+                for child in children:
+                    bound = bind_previous(pipe_config, datasites[child], child)
+                    inputs.append({f"{key}_{child}": committed(bound)})
+            step_config["inputs"] = inputs
+        else:
+            step_config = merge_first_step(foreach_step_config, first_step_config)
+            # a leaf without a `first` override has nothing to chain from
+            step_config["inputs"] = [
+                item
+                for item in step_config["inputs"]
+                if not is_chained_input(next(iter(item.values())))
+            ]
+
+        if step_num == 0:
+            step_config = merge_last_step(step_config, last_step_config)
+        planned_steps.append((step_num, datasite, step_config, context))
+    return planned_steps
+
+
+def star_plan(pipeline):
+    """Every datasite computes its contribution from its own inputs at the
+    same time and shares it with the author, who reduces them all at once in
+    `check_done` (see `star_reduce_step`)."""
+    datasites = pipeline["workflow"]["datasites"]
+    steps = pipeline["steps"]
+    first_step_config = get_step_by_name(steps, "first")
+    foreach_step_config = get_step_by_name(steps, "foreach")
+
+    planned_steps = []
+    for step_num, datasite in enumerate(datasites):
+        context = {
+            "author": pipeline["author"],
+            "datasite": datasite,
+            "project": pipeline["project"],
+            "step": step_num,
+            "next_step": step_num,
+            "next_datasite": pipeline["author"],
+        }
+        step_config = merge_first_step(foreach_step_config, first_step_config)
+        step_config["inputs"] = [
+            item
+            for item in step_config["inputs"]
+            if not is_chained_input(next(iter(item.values())))
+        ]
+        planned_steps.append((step_num, datasite, step_config, context))
+    return planned_steps
+
+
+def star_reduce_step(pipeline):
+    """The author's step for a star: the foreach function applied to every
+    datasite's contribution in one batch, written to the `last` output."""
+    datasites = pipeline["workflow"]["datasites"]
+    steps = pipeline["steps"]
+    foreach_step_config = get_step_by_name(steps, "foreach")
+    last_step_config = get_step_by_name(steps, "last")
+
+    contribution = foreach_step_config["output"]["path"]
+    step_config = merge_last_step(foreach_step_config, last_step_config)
+    step_config["inputs"] = []
+    for step_num, datasite in enumerate(datasites):
+        bound = bind_template(contribution, {"datasite": datasite, "step": step_num})
+        step_config["inputs"].append({f"step_{step_num}": committed(bound)})
+    context = {
+        "author": pipeline["author"],
+        "datasite": pipeline["author"],
+        "project": pipeline["project"],
+        "step": "reduce",
+        "next_datasite": pipeline["author"],
+    }
+    return step_config, context
+
+
+TOPOLOGIES = {
+    "ring": ring_plan,
+    "tree": tree_plan,
+    "star": star_plan,
+}
+
+
+def plan_steps(pipeline):
+    """Lists (step_num, datasite, step_config, context) for every step."""
+    topology = pipeline["workflow"].get("topology", "ring")
+    if topology not in TOPOLOGIES:
+        raise ValueError(f"Unknown topology: {topology}")
+    return TOPOLOGIES[topology](pipeline)
+
+
+@dataclass(frozen=True)
+class CompiledStep:
+    """A step with everything resolved up front: input and output pipes built
+    from their templates, who may read the output and the function to call."""
+
+    step_num: Any
+    datasite: str
+    context: Mapping[str, Any]
+    inputs: Mapping[str, Pipe]
+    output: Pipe
+    folder: str
+    access_emails: Tuple[str, ...]
+    operation: str
+    function: Callable
+    options: Mapping[str, Any]
+    watch_paths: Tuple[str, ...]
+    # steps whose outputs this step reads
+    depends_on: Tuple[Any, ...] = ()
+
+    def ready(self) -> bool:
+        return all(pipe.ready() for pipe in self.inputs.values())
+
+    def fingerprints(self) -> Dict[str, Optional[str]]:
+        return {key: pipe.fingerprint() for key, pipe in self.inputs.items()}
+
+
+@dataclass(frozen=True)
+class CompiledPlan:
+    """Every step of a pipeline compiled for one client, plus the author's
+    completion check and, for a star, the author's reduce step."""
+
+    steps: Tuple[CompiledStep, ...]
+    complete: Optional[Pipe]
+    reduce: Optional[CompiledStep]
+
+    def steps_for(self, email) -> Tuple[CompiledStep, ...]:
+        return tuple(step for step in self.steps if step.datasite == email)
+
+
+def compile_step(client, step_num, datasite, step_config, context, functions):
+    inputs = build_input_pipes(client, step_config, context)
+    output = instantiate_pipe(client, step_config["output"]["path"], context)
+
+    access_emails = [client.email]
+    for emails in step_config["output"]["permissions"].get("read", []):
+        if isinstance(emails, str):
+            emails = [emails]
+        for email in emails:
+            access_emails.append(process_template(email, context))
+
+    return CompiledStep(
+        step_num=step_num,
+        datasite=datasite,
+        context=MappingProxyType(dict(context)),
+        inputs=MappingProxyType(inputs),
+        output=output,
+        folder=os.path.dirname(output.file_path),
+        access_emails=tuple(access_emails),
+        operation=step_config["function"],
+        function=functions.get(step_config["function"]),
+        options=MappingProxyType(dict(step_config.get("options") or {})),
+        watch_paths=tuple(
+            str(path) for pipe in inputs.values() for path in pipe.watch_paths()
+        ),
+    )
+
+
+def link_steps(steps, step):
+    """Fills in which of `steps` produce the inputs of `step`."""
+    producers = {str(other.output.file_path): other.step_num for other in steps}
+    depends_on = tuple(
+        producers[str(pipe.file_path)]
+        for pipe in step.inputs.values()
+        if str(getattr(pipe, "file_path", None)) in producers
+    )
+    return replace(step, depends_on=depends_on)
+
+
+def compile_plan(client, pipeline, project_path=None) -> CompiledPlan:
+    """Turns the pipeline YAML into pipes and functions once, so waiting and
+    retrying only has to check readiness and execute."""
+    functions = FunctionRegistry.for_project(project_path, pipeline)
+    steps = tuple(
+        compile_step(client, step_num, datasite, step_config, context, functions)
+        for step_num, datasite, step_config, context in plan_steps(pipeline)
+    )
+    steps = tuple(link_steps(steps, step) for step in steps)
+
+    complete = None
+    if "complete" in pipeline:
+        context = {
+            "author": pipeline["author"],
+            "datasite": client.email,
+            "project": pipeline["project"],
+        }
+        complete = instantiate_pipe(
+            client, committed(pipeline["complete"]["exists"]), context
+        )
+
+    reduce = None
+    if pipeline["workflow"].get("topology", "ring") == "star":
+        step_config, context = star_reduce_step(pipeline)
+        reduce = compile_step(
+            client, "reduce", pipeline["author"], step_config, context, functions
+        )
+        reduce = link_steps(steps, reduce)
+    return CompiledPlan(steps=steps, complete=complete, reduce=reduce)
+
+
+# compiled plans by client and project folder, each kept with the pipeline
+# document it was compiled from. The YAML cache hands out the same document
+# until the file changes, so identity tells us when to recompile.
+_compiled_plans: Dict[Tuple[str, str, str], Tuple[Any, CompiledPlan]] = {}
+
+
+def get_plan(client, pipeline, project_path=None) -> CompiledPlan:
+    key = (client.email, str(client.sync_folder), str(project_path))
+    cached = _compiled_plans.get(key)
+    if cached is not None and cached[0] is pipeline:
+        return cached[1]
+    plan = compile_plan(client, pipeline, project_path)
+    _compiled_plans[key] = (pipeline, plan)
+    return plan
+
+
+def advance_step(
+    client,
+    step: "CompiledStep",
+    state,
+    logger,
+    deadline,
+    event_driven=True,
+    metrics=None,
+) -> bool:
+    """Runs one step as soon as its inputs are ready, waiting until `deadline`
+    at most. Returns True if the step is done. The run's timings are logged
+    and recorded in `metrics`."""
+    timeout = deadline - time.time()
+    step_num = step.step_num
+    # tags records so the log summary knows which step they are about
+    extra = {"step": step_num}
+    # a step left waiting by an earlier tick has been waiting since then
+    waiting_since = None
+    if state.status(step_num) == WAITING:
+        waiting_since = state.step(step_num).get("updated")
+
+    # the step's pipes are compiled once, so we only sleep until its exact
+    # input files change and re-check readiness
+    if state.status(step_num) == DONE:
+        if step.fingerprints() == state.step(step_num).get("inputs"):
+            # the inputs it ran with, known from a stat each, no hashing
+            return True
+        if not step.ready():
+            # inputs were cleaned up after we ran, nothing left to do
+            return True
+
+    # with timeout <= 0 this is a single non-blocking pass: run what is ready,
+    # record what is still waiting and let the next tick resume
+    while True:
+        remaining = deadline - time.time()
+        wait_start = time.time()
+        if remaining > 0 and not step.ready():
+            # whoever we wait on may be waiting on an output granted earlier
+            get_permission_manager().apply()
+        if not wait_until(step.ready, step.watch_paths, remaining, event_driven):
+            if state.status(step_num) != WAITING:
+                logger.info("Step %s waiting for inputs.", step_num, extra=extra)
+            state.mark(step_num, WAITING)
+            if timeout > 0:
+                logger.error(
+                    "Timeout reached for step %s for %s. Check logs for details.",
+                    step_num,
+                    client.email,
+                    extra=extra,
+                )
+            return False
+
+        fingerprints = step.fingerprints()
+        if not state.should_run(step_num, fingerprints):
+            logger.debug(
+                "Step %s is %s with the same inputs, not rerunning.",
+                step_num,
+                state.status(step_num),
+                extra=extra,
+            )
+            return state.status(step_num) == DONE
+
+        logger.info("Running step %s for %s.", step_num, client.email, extra=extra)
+        state.mark(step_num, READY, fingerprints)
+        timer = StepTimer(wait=time.time() - (waiting_since or wait_start))
+        try:
+            print("tryying to execute step", step_num, step.operation)
+            success = execute_step(client, step, logger, timer)
+            if success:
+                state.mark(step_num, DONE, fingerprints)
+                step_metrics = timer.as_dict()
+                step_metrics["depends_on"] = list(step.depends_on)
+                logger.info(
+                    "Step %s complete for %s.",
+                    step_num,
+                    client.email,
+                    extra={**extra, "metrics": step_metrics},
+                )
+                if metrics is not None:
+                    metrics.record(step_num, step_metrics)
+                return True
+        except Exception as e:
+            state.mark(step_num, FAILED, fingerprints, error=str(e))
+            logger.error(
+                "Step %s for %s failed with error: %s. Retrying...",
+                step_num,
+                client.email,
+                e,
+                extra=extra,
+            )
+            if time.time() + 1 >= deadline:
+                return False
+            time.sleep(1)
+
+
+def run_steps_for_email(
+    client, pipeline, log_file, timeout=10, event_driven=True, project_path=None
+) -> bool:
+    """Advances this datasite's steps of the pipeline.
+
+    Steps already done with the same inputs are skipped. Each step waits up to
+    `timeout` seconds in total for its inputs, 0 makes it a single quick pass.
+    Functions are looked up in the project's code under `project_path`, then
+    in the built-in reducers. Returns True once all of this datasite's steps
+    are done.
+    """
     try:
         logger = setup_logger(log_file)
         email = client.email
         project = pipeline["project"]
         datasites = pipeline["workflow"]["datasites"]
-        steps = pipeline["steps"]
-
-        # Retrieve step configurations by name
-        first_step_config = get_step_by_name(steps, "first")
-        foreach_step_config = get_step_by_name(steps, "foreach")
-        last_step_config = get_step_by_name(steps, "last")
-        print("last_step_config", last_step_config)
 
         start_time = time.time()
 
         print("datasites", datasites, len(datasites))
 
-        for step_num, datasite in enumerate(datasites):
-            logger.info("Running step %d for %s.", step_num, email)
-            if datasite != email:
-                print("SKIPPING STEP", step_num, datasite, email)
-                logger.info("Skipping step %d for other datasite.", step_num)
-                continue
-            print("RUNNING STEP", step_num, datasite, email)
-            print("type", type(pipeline["author"]))
-            context = {
-                "author": pipeline["author"],
-                "datasite": datasite,
-                "project": project,
-                "step": step_num,
-                "prev_step": step_num - 1 if step_num > 0 else len(datasites) - 1,
-                "next_step": (step_num + 1) % len(datasites),
-                "prev_datasite": datasites[step_num - 1]
-                if step_num > 0
-                else datasites[-1],
-                "next_datasite": datasites[(step_num + 1) % len(datasites)],
-            }
-
-            if step_num == 0 and first_step_config:
-                print(">>>> FIRST STEP")
-                step_config = copy.deepcopy(foreach_step_config)
-                first_step_config = first_step_config["first"]
-                print("first_step_config", first_step_config)
-
-                if "inputs" in first_step_config:
-                    first_inputs_dict = {
-                        k: v
-                        for item in first_step_config["inputs"]
-                        for k, v in item.items()
-                    }
-                    foreach_inputs_dict = {
-                        k: v for item in step_config["inputs"] for k, v in item.items()
-                    }
-                    merged_inputs_dict = {**foreach_inputs_dict, **first_inputs_dict}
-                    step_config["inputs"] = [
-                        {k: v} for k, v in merged_inputs_dict.items()
-                    ]
-
-            elif (step_num == len(datasites) - 1) and last_step_config:
-                print(">>>> LAST STEP")
-                logger.info("Running final step for %s", email)
-                step_config = copy.deepcopy(foreach_step_config)
-                last_step_config = last_step_config["last"]
-                print("last_step_config", last_step_config)
-                print("items", last_step_config["output"].items())
-                print("step config", step_config["output"])
-                if "output" in last_step_config:
-                    # Extract last step's output configuration directly as a dictionary
-                    last_output_dict = {
-                        k: v for k, v in last_step_config["output"].items()
-                    }
-
-                    # Extract foreach step's output configuration directly as a dictionary
-                    foreach_output_dict = step_config["output"]
-
-                    # Merge the dictionaries
-                    step_config["output"] = {**foreach_output_dict, **last_output_dict}
-            else:
-                step_config = foreach_step_config
-
-            while time.time() - start_time < timeout:
-                try:
-                    print("tryying to execute step", step_config)
-                    success = execute_step(client, step_config, context, logger)
-                    if success:
-                        logger.info("Step %d complete for %s.", step_num, email)
-                        break
-                    time.sleep(1)
-                except Exception as e:
-                    logger.error(
-                        "Step %d for %s failed with error: %s. Retrying...",
-                        step_num,
-                        email,
-                        e,
-                    )
-                    time.sleep(1)
-            else:
-                logger.error(
-                    "Timeout reached for step %d for %s. Check logs for details.",
-                    step_num,
-                    email,
-                )
+        state = ProjectState.for_project(email, pipeline["author"], project)
+        metrics = ProjectMetrics(
+            metrics_path(log_file), pipeline["author"], project, email
+        )
+        plan = get_plan(client, pipeline, project_path)
+        own_steps = plan.steps_for(email)
+
+        for step in own_steps:
+            print("RUNNING STEP", step.step_num, step.datasite, email)
+            advance_step(
+                client,
+                step,
+                state,
+                logger,
+                start_time + timeout,
+                event_driven,
+                metrics,
+            )
+        get_permission_manager().apply()
+
+        return all(state.status(step.step_num) == DONE for step in own_steps)
     except Exception as e:
         logger.error("An error occurred during run_steps_for_email: %s", e)
         logger.debug("Traceback:\n%s", traceback.format_exc())  # Full traceback
@@ -287,6 +721,20 @@ def run_steps_for_email(client, pipeline, log_file, timeout=10):
         raise e
 
 
+def watched_paths(client, pipeline, project_path=None) -> List[str]:
+    """The files this datasite's steps of a project read, plus the author's
+    completion check. A change to any of them is a reason to run a tick."""
+    plan = get_plan(client, pipeline, project_path)
+    steps = list(plan.steps_for(client.email))
+    paths = [path for step in steps for path in step.watch_paths]
+    if client.email == pipeline["author"]:
+        if plan.complete is not None:
+            paths.extend(str(path) for path in plan.complete.watch_paths())
+        if plan.reduce is not None:
+            paths.extend(plan.reduce.watch_paths)
+    return paths
+
+
 def check_done(client, pipeline, project, log_file, timeout=10) -> Tuple[bool, bool]:
     try:
         logger = setup_logger(log_file)
@@ -295,19 +743,25 @@ def check_done(client, pipeline, project, log_file, timeout=10) -> Tuple[bool, b
 
         is_author = email == author
         if is_author:
+            plan = get_plan(client, pipeline, project.get("project_path"))
             project = pipeline["project"]
             print(pipeline)
 
-            complete = pipeline["complete"]
-            exists_pipe_conf = complete["exists"]
-
-            context = {
-                "author": pipeline["author"],
-                "datasite": email,
-                "project": project,
-            }
-            print("got the complete condiction", complete, exists_pipe_conf)
-            exists_pipe = instantiate_pipe(client, exists_pipe_conf, context)
+            exists_pipe = plan.complete
+            print("got the complete condiction", pipeline["complete"])
+
+            if plan.reduce is not None and not exists_pipe.ready():
+                state = ProjectState.for_project(email, author, project)
+                metrics = ProjectMetrics(metrics_path(log_file), author, project, email)
+                advance_step(
+                    client,
+                    plan.reduce,
+                    state,
+                    logger,
+                    time.time() + timeout,
+                    metrics=metrics,
+                )
+                get_permission_manager().apply()
             print("exists_pipe")
             print("exists_pipe", exists_pipe.ready())
             return exists_pipe.ready(), is_author
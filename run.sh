@@ -7,8 +7,14 @@ if [ ! -d .venv ]; then
 fi
 . .venv/bin/activate
 
-uv pip install --upgrade syftbox
-uv pip install -r requirements.txt
+# installing takes far longer than a tick with nothing to do, so only do it
+# when requirements change and otherwise once a day for syftbox upgrades
+STAMP=.venv/.installed
+if [ ! -f $STAMP ] || [ requirements.txt -nt $STAMP ] || [ -n "$(find $STAMP -mtime +0)" ]; then
+    uv pip install --upgrade syftbox
+    uv pip install -r requirements.txt
+    touch $STAMP
+fi
 
 echo "Running '$pwd' with $(python3 --version) at '$(which python3)'"
 python3 main.py
@@ -1,10 +1,16 @@
+import fnmatch
 import os
 import json
 import shutil
-from typing import List, Optional, Tuple
+from typing import TYPE_CHECKING, List, Optional, Tuple
 from pathlib import Path
 import hashlib
-from syftbox.lib import Client
+import threading
+
+if TYPE_CHECKING:
+    from syftbox.lib import Client
+
+DEFAULT_VERIFIED_FILE = "./verified_payloads.json"
 
 
 class Pipe:
@@ -26,11 +32,149 @@ class Pipe:
             "Subclasses or instances must implement the ready method."
         )
 
+    def watch_paths(self) -> List[str]:
+        """Files whose changes can make the pipe ready."""
+        return []
+
+    def fingerprint(self) -> Optional[str]:
+        """Identifies the current value, None if there is nothing to read."""
+        return None
+
+    def size(self) -> int:
+        """Bytes stored behind the pipe, 0 if there are none."""
+        return 0
+
+
+class HashingWriter:
+    """Wraps a binary file, hashing and counting everything written to it."""
+
+    def __init__(self, file):
+        self.file = file
+        self.hash = hashlib.sha256()
+        self.length = 0
+
+    def write(self, data):
+        self.hash.update(data)
+        self.length += memoryview(data).nbytes
+        return self.file.write(data)
+
+
+def payload_stat(path) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class VerifiedPayloads:
+    """Payloads already checked against their commit, by path, with the
+    sha256, size and mtime_ns they had then.
+
+    Persisted to `./verified_payloads.json`, since every tick is a new
+    process: a payload is hashed once per committed version, later ticks
+    only compare its size and mtime with the record.
+    """
+
+    def __init__(self, filename=DEFAULT_VERIFIED_FILE):
+        self.filename = filename
+        self.records = self._load()
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.filename, "r") as file:
+                return json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def matches(self, path, sha256, stat) -> bool:
+        return self.records.get(path) == [sha256, *stat]
+
+    def remember(self, path, sha256, stat):
+        with self.lock:
+            if self.records.get(path) != [sha256, *stat]:
+                self.records[path] = [sha256, *stat]
+                self.dirty = True
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            # payloads that went away, e.g. outputs of a cleaned up project
+            for path in [path for path in self.records if not os.path.exists(path)]:
+                del self.records[path]
+            tmp_path = f"{self.filename}.tmp"
+            with open(tmp_path, "w") as file:
+                json.dump(self.records, file, separators=(",", ":"))
+            os.replace(tmp_path, self.filename)
+            self.dirty = False
+
+
+_verified_payloads: Optional[VerifiedPayloads] = None
+
+
+def get_verified_payloads() -> VerifiedPayloads:
+    """Process-wide records, saved by app.py at the end of a tick."""
+    global _verified_payloads
+    if _verified_payloads is None:
+        _verified_payloads = VerifiedPayloads()
+    return _verified_payloads
+
+
+def verify_payload(path, length, sha256) -> bool:
+    """Whether the file at `path` has the committed length and hash."""
+    path = os.path.abspath(str(path))
+    before = payload_stat(path)
+    if before is None or before[0] != length:
+        return False
+    verified = get_verified_payloads()
+    if verified.matches(path, sha256, before):
+        return True
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(block)
+    except OSError:
+        return False
+    if digest.hexdigest() != sha256:
+        return False
+    # only remembered if the payload didn't change while it was hashed
+    if payload_stat(path) == before:
+        verified.remember(path, sha256, before)
+    return True
+
+
+def remember_payload(path, sha256):
+    """Records a payload we just wrote ourselves as verified."""
+    path = os.path.abspath(str(path))
+    stat = payload_stat(path)
+    if stat is not None:
+        get_verified_payloads().remember(path, sha256, stat)
+
 
 class FilePipe(Pipe):
-    def __init__(self, file_path):
-        """Initializes the FilePipe with a specific file path."""
+    """A value stored in a file.
+
+    Writes go to a temporary file that is renamed into place, followed by a
+    `<file>.commit` record with the payload's length and SHA-256. A reader
+    only treats the file as ready once the record has arrived and the payload
+    matches it, so it never picks up a half-written, half-synced or stale
+    payload. The hash is checked once per committed payload.
+    """
+
+    def __init__(self, file_path, require_commit=False):
+        """Initializes the FilePipe with a specific file path.
+
+        With `require_commit` the file is only ready once its commit record
+        exists, use it for files written by other steps. Files without a
+        record, such as data put in place by hand, are otherwise ready as soon
+        as they exist.
+        """
         self.file_path = file_path
+        self.require_commit = require_commit
 
     @classmethod
     def create(cls, file_path, initial_value=0):
@@ -46,11 +190,27 @@ class FilePipe(Pipe):
         instance.write(initial_value)
         return instance
 
+    @property
+    def commit_path(self) -> str:
+        return f"{self.file_path}.commit"
+
+    def commit(self) -> Optional[dict]:
+        """Returns the commit record, None if there isn't a valid one."""
+        try:
+            with open(self.commit_path, "r") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
     def read(self):
         """Reads and returns integer data from the file."""
         try:
-            with open(self.file_path, "r") as file:
-                data = int(file.read().strip())  # Assumes integer data for simplicity
+            if not self.matches_commit():
+                print(f"Error: The file {self.file_path} does not match its commit.")
+                return None
+            with open(self.file_path, "rb") as file:
+                raw = file.read()
+            data = int(raw.decode().strip())  # Assumes integer data for simplicity
             return data
         except FileNotFoundError:
             print(f"Error: The file {self.file_path} was not found.")
@@ -61,17 +221,273 @@ class FilePipe(Pipe):
             )
             return None
 
+    def write_payload(self, file, data):
+        """Writes the encoded value to an open binary file."""
+        file.write(str(data).encode())
+
     def write(self, data):
-        """Writes integer data to the file as a string."""
+        """Atomically writes the value, then its commit record."""
+        directory, name = os.path.split(str(self.file_path))
+        tmp_path = os.path.join(directory, f".{name}.tmp")
         try:
-            with open(self.file_path, "w") as file:
-                file.write(str(data))
+            with open(tmp_path, "wb") as file:
+                writer = HashingWriter(file)
+                self.write_payload(writer, data)
+
+            # drop the previous record first so the new payload can never be
+            # matched against it
+            if os.path.exists(self.commit_path):
+                os.unlink(self.commit_path)
+            os.replace(tmp_path, self.file_path)
+
+            commit = {"length": writer.length, "sha256": writer.hash.hexdigest()}
+            tmp_commit_path = os.path.join(directory, f".{name}.commit.tmp")
+            with open(tmp_commit_path, "w") as file:
+                json.dump(commit, file)
+            os.replace(tmp_commit_path, self.commit_path)
+            remember_payload(self.file_path, commit["sha256"])
         except IOError as e:
             print(f"Error: Could not write to file {self.file_path} - {e}")
+            # the step must not count as done without its payload and record
+            raise
+
+    def matches_commit(self) -> bool:
+        """Whether the payload matches its commit record, True for files
+        without one."""
+        commit = self.commit()
+        if commit is None:
+            return True
+        return verify_payload(
+            self.file_path, commit.get("length"), commit.get("sha256")
+        )
+
+    def ready(self) -> bool:
+        """Check the committed payload has fully arrived."""
+        if self.commit() is None:
+            return not self.require_commit and os.path.exists(self.file_path)
+        return self.matches_commit()
+
+    def watch_paths(self) -> List[str]:
+        """The file and its commit record."""
+        return [str(self.file_path), self.commit_path]
+
+    def size(self) -> int:
+        try:
+            return os.path.getsize(self.file_path)
+        except OSError:
+            return 0
+
+    def fingerprint(self) -> Optional[str]:
+        """Size and mtime of the payload, with the committed hash when there
+        is a record. A payload that lands or is corrected after its record
+        changes the fingerprint, so a step that failed on it runs again."""
+        stat = payload_stat(self.file_path)
+        payload = None if stat is None else f"{stat[0]}-{stat[1]}"
+        commit = self.commit()
+        if commit is not None:
+            return f"sha256:{commit.get('sha256')}:{payload}"
+        return payload
+
+
+class ArrayPipe(FilePipe):
+    """A NumPy array stored as a binary `.npy` file.
+
+    Reads are memory-mapped so large arrays are paged in on demand instead of
+    being loaded or parsed up front. The payload is checked against its
+    commit record before it is mapped, once per committed payload.
+    """
+
+    def read(self):
+        """Returns the array memory-mapped read-only."""
+        import numpy as np
+
+        try:
+            if not self.matches_commit():
+                print(f"Error: The file {self.file_path} does not match its commit.")
+                return None
+            return np.load(self.file_path, mmap_mode="r")
+        except FileNotFoundError:
+            print(f"Error: The file {self.file_path} was not found.")
+            return None
+        except ValueError as e:
+            print(f"Error: The file {self.file_path} is not a valid array - {e}")
+            return None
+
+    def write_payload(self, file, data):
+        """Writes data as a binary `.npy` array."""
+        import numpy as np
+
+        np.save(file, np.asarray(data))
+
+
+class ChunkedPipe(Pipe):
+    """A large array stored as fixed-size `.npy` chunk files plus a
+    `manifest.json`, so it can be written and read one chunk at a time.
+
+    `file_path` is the folder holding the chunks. Each chunk is renamed into
+    place, and the manifest, written last, records the shape, dtype, chunk
+    size and the length and SHA-256 of every chunk, so chunks left over from
+    an earlier value are never read as part of a new one.
+    """
+
+    MANIFEST = "manifest.json"
+    DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024  # elements per chunk
+
+    def __init__(self, file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Initializes the ChunkedPipe with the folder holding the chunks."""
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.file_path, self.MANIFEST)
+
+    def chunk_path(self, index: int) -> str:
+        return os.path.join(self.file_path, f"chunk-{index:06d}.npy")
+
+    def manifest(self) -> Optional[dict]:
+        """Returns the manifest, None if the pipe hasn't been written yet."""
+        try:
+            with open(self.manifest_path, "r") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def chunk_matches(self, manifest, index) -> bool:
+        """Whether a chunk is the one the manifest lists. Manifests without
+        checksums only need the chunk to exist."""
+        checksums = manifest.get("checksums")
+        if checksums is None:
+            return os.path.exists(self.chunk_path(index))
+        checksum = checksums[index]
+        return verify_payload(
+            self.chunk_path(index), checksum["length"], checksum["sha256"]
+        )
+
+    def iter_chunks(self):
+        """Yields each chunk as a flat memory-mapped array."""
+        import numpy as np
+
+        manifest = self.manifest()
+        if manifest is None:
+            return
+        for index in range(manifest["chunks"]):
+            if not self.chunk_matches(manifest, index):
+                raise ValueError(
+                    f"Chunk {index} of {self.file_path} does not match its manifest."
+                )
+            yield np.load(self.chunk_path(index), mmap_mode="r")
+
+    def read(self):
+        """Returns the whole array. Only for values that fit in memory, use
+        `iter_chunks` otherwise."""
+        import numpy as np
+
+        manifest = self.manifest()
+        if manifest is None:
+            print(f"Error: The chunked array {self.file_path} was not found.")
+            return None
+        try:
+            chunks = list(self.iter_chunks())
+        except ValueError as e:
+            print(f"Error: {e}")
+            return None
+        if not chunks:
+            return np.zeros(manifest["shape"], dtype=manifest["dtype"])
+        return np.concatenate(chunks).reshape(manifest["shape"])
+
+    def write(self, data):
+        """Splits an array into chunks and writes them."""
+        import numpy as np
+
+        array = np.asarray(data)
+        flat = array.reshape(-1)
+        chunks = (
+            flat[start : start + self.chunk_size]
+            for start in range(0, flat.size, self.chunk_size)
+        )
+        self.write_chunks(chunks, array.shape, array.dtype)
+
+    def write_chunks(self, chunks, shape, dtype=None) -> dict:
+        """Writes chunks from an iterable one at a time, then the manifest.
+
+        Only one chunk needs to be in memory at once, so `chunks` can be a
+        generator producing a value far larger than RAM.
+        """
+        import numpy as np
+
+        os.makedirs(self.file_path, exist_ok=True)
+        # readers must never see a manifest next to half-replaced chunks
+        if os.path.exists(self.manifest_path):
+            os.unlink(self.manifest_path)
+
+        checksums = []
+        for chunk in chunks:
+            chunk = np.asarray(chunk).reshape(-1)
+            dtype = dtype or chunk.dtype
+            path = self.chunk_path(len(checksums))
+            tmp_path = os.path.join(self.file_path, f".{os.path.basename(path)}.tmp")
+            with open(tmp_path, "wb") as file:
+                writer = HashingWriter(file)
+                np.save(writer, chunk)
+            os.replace(tmp_path, path)
+            sha256 = writer.hash.hexdigest()
+            remember_payload(path, sha256)
+            checksums.append({"length": writer.length, "sha256": sha256})
+        count = len(checksums)
+
+        # drop chunks left over from a larger previous value
+        stale = count
+        while os.path.exists(self.chunk_path(stale)):
+            os.unlink(self.chunk_path(stale))
+            stale += 1
+
+        manifest = {
+            "shape": list(shape),
+            "dtype": str(np.dtype(dtype or "float64")),
+            "chunk_size": self.chunk_size,
+            "chunks": count,
+            "checksums": checksums,
+        }
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(manifest, file)
+        os.replace(tmp_path, self.manifest_path)
+        return manifest
 
     def ready(self) -> bool:
-        """Check if the file is ready to be read from or written to."""
-        return os.path.exists(self.file_path)
+        """Check the manifest and every chunk it lists have arrived."""
+        manifest = self.manifest()
+        if manifest is None:
+            return False
+        return all(
+            self.chunk_matches(manifest, index) for index in range(manifest["chunks"])
+        )
+
+    def watch_paths(self) -> List[str]:
+        """The manifest, it is written after all the chunks."""
+        return [self.manifest_path]
+
+    def size(self) -> int:
+        """The chunks listed in the manifest."""
+        manifest = self.manifest()
+        if manifest is None:
+            return 0
+        total = 0
+        for index in range(manifest["chunks"]):
+            try:
+                total += os.path.getsize(self.chunk_path(index))
+            except OSError:
+                pass
+        return total
+
+    def fingerprint(self) -> Optional[str]:
+        """Size and mtime of the manifest."""
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        return f"{stat.st_size}-{stat.st_mtime_ns}"
 
 
 class StaticPipe(Pipe):
@@ -91,6 +507,10 @@ class StaticPipe(Pipe):
         """Check if the static value is ready to be read from or written to."""
         return True
 
+    def fingerprint(self) -> Optional[str]:
+        """The static value itself."""
+        return repr(self.value)
+
 
 def map_reduce(input_pipe_1, input_pipe_2, operation, output_pipe):
     try:
@@ -149,6 +569,13 @@ class Settings:
         return self.data
 
 
+def write_atomic(path, data: bytes):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
+
 def extract_datasite(path: str) -> Optional[str]:
     right = str(path).split("datasites/")
     datasite = right[1].split("/")[0]
@@ -157,12 +584,16 @@ def extract_datasite(path: str) -> Optional[str]:
     return None
 
 
-def datasites_file_glob(client: Client, pattern: str) -> List[Tuple[str, Path]]:
+def datasites_path(client: "Client") -> Path:
     datasites = Path(f"{client.sync_folder}")
     # fixes change in client paths
     if "datasites" not in str(datasites):
         datasites = datasites / "datasites"
+    return datasites
+
 
+def datasites_file_glob(client: "Client", pattern: str) -> List[Tuple[str, Path]]:
+    datasites = datasites_path(client)
     matches = datasites.glob(pattern)
     results = []
     for path in matches:
@@ -191,33 +622,186 @@ def calculate_file_hash(file_path, hash_func=hashlib.sha256):
     return hash_obj.hexdigest()
 
 
-def ensure(files, destination_folder):
-    """Ensure that specified files are in the destination folder with the same
-    hashes. If the destination folder doesn't exist, create it.
-    Copy files if missing or hashes differ."""
+# what ensure() last published and the digests of the files involved
+DEFAULT_MANIFEST_FILE = "./publish_manifest.json"
 
-    # Ensure destination folder exists
-    Path(destination_folder).mkdir(parents=True, exist_ok=True)
 
-    for src_file_path in files:
-        # Check if the source file exists
-        if not os.path.exists(src_file_path):
-            print(f"Source file '{src_file_path}' does not exist.")
-            continue
+def file_signature(stat) -> List[int]:
+    """Changes whenever a file is rewritten or replaced."""
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
 
-        file_name = os.path.basename(src_file_path)
-        dest_file_path = os.path.join(destination_folder, file_name)
+class PublishManifest:
+    """Remembers what `ensure` copied where.
 
-        # Calculate the hash of the source file
-        src_hash = calculate_file_hash(src_file_path)
+    Digests are cached by (size, mtime_ns, inode), and each published file is
+    recorded with the digest of its source and its own signature. A source
+    and destination that both still match cost a `stat` each, a file is only
+    hashed when its signature changed and only copied when its content did.
+    """
 
-        # Check if destination file exists and has the same hash
-        if os.path.exists(dest_file_path):
-            dest_hash = calculate_file_hash(dest_file_path)
-            if src_hash == dest_hash:
-                print(f"File '{file_name}' is up-to-date.")
-                continue  # Skip copying as the file is the same
+    def __init__(self, filename=DEFAULT_MANIFEST_FILE):
+        self.filename = filename
+        self.digests = {}
+        self.published = {}
+        self.dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.filename, "r") as file:
+                data = json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return
+        self.digests = data.get("digests", {})
+        self.published = data.get("published", {})
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp_path = f"{self.filename}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(
+                {"digests": self.digests, "published": self.published},
+                file,
+                separators=(",", ":"),
+            )
+        os.replace(tmp_path, self.filename)
+        self.dirty = False
+
+    def digest(self, path: str, stat) -> str:
+        signature = file_signature(stat)
+        cached = self.digests.get(path)
+        if cached is not None and cached["signature"] == signature:
+            return cached["sha256"]
+        digest = calculate_file_hash(path)
+        self.digests[path] = {"signature": signature, "sha256": digest}
+        self.dirty = True
+        return digest
+
+    def publish(self, source: str, destination: str) -> bool:
+        """Copies `source` to `destination` unless it is already there.
+        Returns True if it copied."""
+        source_stat = os.stat(source)
+        record = self.published.get(destination)
+        try:
+            destination_stat = os.stat(destination)
+        except FileNotFoundError:
+            destination_stat = None
+
+        source_signature = file_signature(source_stat)
+        if (
+            record is not None
+            and destination_stat is not None
+            and record["source_signature"] == source_signature
+            and record["signature"] == file_signature(destination_stat)
+        ):
+            return False
+
+        source_digest = self.digest(source, source_stat)
+        if destination_stat is not None:
+            if record is not None and record["signature"] == file_signature(
+                destination_stat
+            ):
+                destination_digest = record["sha256"]
+            else:
+                destination_digest = self.digest(destination, destination_stat)
+            copied = destination_digest != source_digest
+        else:
+            copied = True
+
+        if copied:
+            # renamed into place so peers never sync a half-written file
+            directory, name = os.path.split(destination)
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = os.path.join(directory, f".{name}.tmp")
+            shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, destination)
+            destination_stat = os.stat(destination)
+
+        self.published[destination] = {
+            "source": source,
+            "source_signature": source_signature,
+            "sha256": source_digest,
+            "signature": file_signature(destination_stat),
+        }
+        self.digests.pop(destination, None)
+        self.dirty = True
+        return copied
+
+    def unpublish(self, destination: str):
+        """Removes a file we published whose source is gone."""
+        try:
+            os.unlink(destination)
+        except FileNotFoundError:
+            pass
+        del self.published[destination]
+        self.dirty = True
+
+
+def walk_files(folder: str, exclude=()) -> List[str]:
+    """Files below `folder`, relative to it, skipping names in `exclude`."""
+    files = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if any(fnmatch.fnmatch(entry.name, pattern) for pattern in exclude):
+                continue
+            if entry.is_dir():
+                files.extend(
+                    os.path.join(entry.name, name)
+                    for name in walk_files(entry.path, exclude)
+                )
+            else:
+                files.append(entry.name)
+    return files
+
+
+_publish_manifest: Optional[PublishManifest] = None
+
+
+def get_publish_manifest() -> PublishManifest:
+    global _publish_manifest
+    if _publish_manifest is None:
+        _publish_manifest = PublishManifest()
+    return _publish_manifest
+
+
+def ensure(files, destination_folder, exclude=()) -> List[str]:
+    """Ensure that the given files are in the destination folder with the
+    same content, copying only what is missing or changed.
+
+    A directory in `files` is mirrored: its contents land in the destination
+    folder under the same relative paths, and files we published from it
+    earlier that are gone from it are removed. Names matching a pattern in
+    `exclude` are skipped. Returns the destination paths that were copied.
+    """
+    manifest = get_publish_manifest()
+    destination_folder = os.path.abspath(str(destination_folder))
+    copied = []
+    for src_path in files:
+        src_path = os.path.abspath(str(src_path))
+        if os.path.isdir(src_path):
+            pairs = [
+                (os.path.join(src_path, rel), os.path.join(destination_folder, rel))
+                for rel in walk_files(src_path, exclude)
+            ]
+            sources = {source for source, _ in pairs}
+            for destination, record in list(manifest.published.items()):
+                if (
+                    record["source"].startswith(src_path + os.sep)
+                    and record["source"] not in sources
+                ):
+                    manifest.unpublish(destination)
+        elif os.path.exists(src_path):
+            name = os.path.basename(src_path)
+            pairs = [(src_path, os.path.join(destination_folder, name))]
+        else:
+            print(f"Source file '{src_path}' does not exist.")
+            continue
 
-        # Copy file from source to destination
-        shutil.copy2(src_file_path, dest_file_path)
-        print(f"Copied '{file_name}' to '{dest_file_path}'.")
+        for source, destination in pairs:
+            if manifest.publish(source, destination):
+                print(f"Copied '{os.path.basename(source)}' to '{destination}'.")
+                copied.append(destination)
+    manifest.save()
+    return copied
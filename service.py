@@ -0,0 +1,140 @@
+"""Resident command service for the widget.
+
+Keeps the client, the project index and parsed YAML in memory and answers
+the same JSON commands as `command.py` over a local Unix socket, one JSON
+request and one JSON reply per connection:
+
+    request:  {"command": "list_projects", ...}
+    reply:    {"output": <command response>, "exit_code": 0}
+
+`command.py` tries the service first and starts it when it isn't running,
+so it comes up with the first widget action and exits after being idle
+for IDLE_TIMEOUT seconds. Run it directly with `python service.py`.
+"""
+
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Optional
+
+SOCKET_PATH = "./command.sock"
+# the service exits after this long without a request
+IDLE_TIMEOUT = 15 * 60
+# list_projects re-checks the sync folder at most this often
+REFRESH_INTERVAL = 1.0
+CONNECT_TIMEOUT = 0.5
+REQUEST_TIMEOUT = 30.0
+
+
+def _recv_all(conn) -> bytes:
+    chunks = []
+    while True:
+        chunk = conn.recv(64 * 1024)
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
+
+
+def request(data, socket_path=SOCKET_PATH) -> Optional[Any]:
+    """Sends a command to the service. Returns its reply, or None if no
+    service is listening."""
+    try:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.settimeout(CONNECT_TIMEOUT)
+        conn.connect(socket_path)
+    except OSError:
+        return None
+    with conn:
+        conn.settimeout(REQUEST_TIMEOUT)
+        conn.sendall(json.dumps(data).encode())
+        conn.shutdown(socket.SHUT_WR)
+        reply = _recv_all(conn)
+    return json.loads(reply) if reply else None
+
+
+def start_in_background(socket_path=SOCKET_PATH):
+    """Launches the service detached from the calling process."""
+    service = os.path.join(os.path.dirname(os.path.abspath(__file__)), "service.py")
+    subprocess.Popen(
+        [sys.executable, service, socket_path],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+class CommandService:
+    """Answers commands with a warm client, index and YAML cache."""
+
+    def __init__(self, client, index):
+        self.client = client
+        self.index = index
+        self.refreshed = time.monotonic()
+
+    def refresh(self, force=False):
+        if force or time.monotonic() - self.refreshed >= REFRESH_INTERVAL:
+            self.index.refresh()
+            self.index.save()
+            self.refreshed = time.monotonic()
+
+    def handle(self, data):
+        from commands import WRITE_COMMANDS, run_command
+
+        if data.get("command") == "ping":
+            return {"output": {"result": "pong"}, "exit_code": 0}
+        # starting a project must see every join that has arrived
+        self.refresh(force=data.get("command") == "start")
+        output, exit_code = run_command(self.client, self.index, data)
+        if data.get("command") in WRITE_COMMANDS:
+            self.refresh(force=True)
+        return {"output": output, "exit_code": exit_code}
+
+
+def serve(socket_path=SOCKET_PATH, idle_timeout=IDLE_TIMEOUT):
+    from syftbox.lib import Client
+    from index import load_index
+
+    if request({"command": "ping"}, socket_path) is not None:
+        # another service already owns the socket
+        return
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    client = Client.load()
+    index = load_index(client)
+    index.save()
+    service = CommandService(client, index)
+
+    # clean up the socket when stopped
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen()
+    server.settimeout(idle_timeout)
+    try:
+        while True:
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                break
+            with conn:
+                try:
+                    conn.settimeout(REQUEST_TIMEOUT)
+                    data = json.loads(_recv_all(conn))
+                    reply = service.handle(data)
+                except Exception as e:
+                    reply = {"output": {"error": str(e)}, "exit_code": 1}
+                conn.sendall(json.dumps(reply).encode())
+    finally:
+        server.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    serve(*sys.argv[1:2])
@@ -0,0 +1,112 @@
+import os
+import json
+import time
+from typing import Dict, Optional
+
+STATE_DIR = "./state"
+
+WAITING = "waiting"
+READY = "ready"
+DONE = "done"
+FAILED = "failed"
+
+# failed steps are retried on later ticks until this many attempts, unless
+# their inputs change, which always earns a fresh attempt
+MAX_ATTEMPTS = 3
+
+
+class ProjectState:
+    """Persisted progress of one project's steps on this datasite.
+
+    Each step records its status (waiting, ready, done or failed) and the
+    fingerprints of the inputs it last ran with, so a later tick can skip
+    work that already happened and re-run only when an input changes.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.data = self._load()
+
+    @classmethod
+    def for_project(cls, email, author, project, state_dir=STATE_DIR):
+        return cls(os.path.join(state_dir, email, author, f"{project}.json"))
+
+    def _load(self):
+        if os.path.exists(self.filename):
+            with open(self.filename, "r") as file:
+                try:
+                    return json.load(file)
+                except json.JSONDecodeError:
+                    pass
+        return {"steps": {}}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        tmp_path = f"{self.filename}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(self.data, file, indent=4)
+        os.replace(tmp_path, self.filename)
+
+    def step(self, step_num) -> Dict:
+        return self.data["steps"].get(str(step_num), {})
+
+    def status(self, step_num) -> Optional[str]:
+        return self.step(step_num).get("status")
+
+    def should_run(self, step_num, fingerprints: Dict[str, Optional[str]]) -> bool:
+        """Whether a step whose inputs are ready still needs to execute."""
+        step = self.step(step_num)
+        status = step.get("status")
+        same_inputs = step.get("inputs") == fingerprints
+        if status == DONE:
+            return not same_inputs
+        if status == FAILED:
+            return not same_inputs or step.get("attempts", 0) < MAX_ATTEMPTS
+        return True
+
+    def mark(
+        self,
+        step_num,
+        status: str,
+        fingerprints: Optional[Dict[str, Optional[str]]] = None,
+        error: Optional[str] = None,
+    ):
+        step = dict(self.step(step_num))
+        previous = dict(step)
+        if fingerprints is not None and fingerprints != step.get("inputs"):
+            step["inputs"] = fingerprints
+            step["attempts"] = 0
+        if status == FAILED:
+            step["attempts"] = step.get("attempts", 0) + 1
+            step["error"] = error
+        else:
+            step.pop("error", None)
+        step["status"] = status
+
+        if step != previous:
+            step["updated"] = time.time()
+            self.data["steps"][str(step_num)] = step
+            self.save()
+
+    def retry_pending(self) -> bool:
+        """Whether a failed step still has attempts left."""
+        return any(
+            step.get("status") == FAILED and step.get("attempts", 0) < MAX_ATTEMPTS
+            for step in self.data["steps"].values()
+        )
+
+    def all_done(self) -> bool:
+        steps = self.data["steps"].values()
+        return bool(steps) and all(step.get("status") == DONE for step in steps)
+
+    def lifecycle(self) -> Dict:
+        """Where the project is (join, running or complete), and the moves
+        of a transition that hasn't finished yet."""
+        return self.data.get("lifecycle", {})
+
+    def set_lifecycle(self, state: str, pending: Optional[list] = None):
+        record = {"state": state, "updated": time.time()}
+        if pending:
+            record["pending"] = pending
+        self.data["lifecycle"] = record
+        self.save()
@@ -0,0 +1,93 @@
+"""Decides whether an app tick has anything to do.
+
+A full tick ends by recording the mtimes of the directories the app reads
+and the stat signature of the files its steps wait on. The next tick only
+stats those paths. If nothing moved, it exits without loading the client,
+YAML or numpy. Only the standard library is imported here.
+"""
+
+import json
+import os
+import time
+from typing import Dict, Iterable, Optional
+
+TICK_FILE = "./tick.json"
+APP_NAME = "fedreduce"
+# run a full tick at least this often, for changes a stat can't see such as
+# a file rewritten in place within the same second
+MAX_SKIP_SECONDS = 300
+# mtimes this close to the snapshot may hide a later change in the same tick
+RACY_WINDOW_NS = 2_000_000_000
+SETTINGS_FILE = "./settings.json"
+
+
+def stat_signature(path) -> Optional[list]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def walk_dirs(path) -> Iterable[str]:
+    """`path` and every directory below it, if it exists."""
+    if not os.path.isdir(path):
+        yield path
+        return
+    for root, dirs, _ in os.walk(path):
+        yield root
+
+
+def take_snapshot(
+    sync_folder, email, paths: Iterable = (), force: bool = False
+) -> Dict:
+    """Records what the next tick compares against.
+
+    Covers the datasites folder itself (new datasites), every datasite's
+    public fedreduce tree, our private fedreduce folder, the settings and the
+    given `paths`, which are the inputs our steps read. With `force` the next
+    tick always runs, e.g. while a failed step still has retries left.
+    """
+    sync_folder = str(sync_folder)
+    dirs = [sync_folder]
+    with os.scandir(sync_folder) as it:
+        for entry in it:
+            if "@" in entry.name and entry.is_dir(follow_symlinks=False):
+                dirs.extend(walk_dirs(os.path.join(entry.path, "public", APP_NAME)))
+    dirs.extend(walk_dirs(os.path.join(sync_folder, email, APP_NAME)))
+
+    files = {SETTINGS_FILE, *(str(path) for path in paths)}
+    return {
+        "taken_ns": time.time_ns(),
+        "force": force,
+        "dirs": {path: stat_signature(path) for path in dirs},
+        "files": {path: stat_signature(path) for path in sorted(files)},
+    }
+
+
+def save_tick(snapshot, filename=TICK_FILE):
+    tmp_path = f"{filename}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(snapshot, file, separators=(",", ":"))
+    os.replace(tmp_path, filename)
+
+
+def can_skip(filename=TICK_FILE, max_skip_seconds=MAX_SKIP_SECONDS) -> bool:
+    """True if nothing the app depends on changed since the last full tick."""
+    try:
+        with open(filename, "r") as file:
+            snapshot = json.load(file)
+    except (OSError, ValueError):
+        return False
+
+    taken_ns = snapshot["taken_ns"]
+    if snapshot.get("force") or time.time_ns() - taken_ns > max_skip_seconds * 1e9:
+        return False
+
+    for group in ("dirs", "files"):
+        for path, signature in snapshot[group].items():
+            if stat_signature(path) != signature:
+                return False
+            if signature is not None and signature[1] > taken_ns - RACY_WINDOW_NS:
+                return False
+    return True
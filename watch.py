@@ -0,0 +1,145 @@
+import ctypes
+import ctypes.util
+import os
+import random
+import select
+import sys
+import time
+from typing import Callable, Iterable, Optional
+
+# inotify event masks, see inotify(7)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# fallback polling starts fast and backs off towards MAX_BACKOFF
+MIN_BACKOFF = 0.005
+MAX_BACKOFF = 1.0
+BACKOFF_FACTOR = 1.5
+JITTER = 0.25
+
+
+def nearest_existing_dir(path) -> Optional[str]:
+    """The closest ancestor of `path` that exists, so we are told when the
+    missing parts get created."""
+    current = os.path.dirname(os.path.abspath(path))
+    while current and not os.path.isdir(current):
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
+    return current or None
+
+
+class InotifyWatcher:
+    """Minimal inotify binding over ctypes, watching directories for entries
+    being created, renamed into place or finished writing."""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.watched = set()
+
+    def watch(self, directory: str):
+        if directory in self.watched:
+            return
+        wd = self.libc.inotify_add_watch(
+            self.fd, os.fsencode(directory), ctypes.c_uint32(WATCH_MASK)
+        )
+        if wd >= 0:
+            self.watched.add(directory)
+
+    def wait(self, timeout: float) -> bool:
+        """Block until an event arrives or `timeout` passes. Returns True if
+        there were events."""
+        readable, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        if not readable:
+            return False
+        try:
+            while os.read(self.fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+def create_watcher() -> Optional[InotifyWatcher]:
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        return InotifyWatcher()
+    except (OSError, AttributeError):
+        return None
+
+
+def backoff_delays(
+    minimum=MIN_BACKOFF, maximum=MAX_BACKOFF, factor=BACKOFF_FACTOR, jitter=JITTER
+):
+    """Yield growing sleep intervals with random jitter so many waiting steps
+    don't wake in lockstep."""
+    delay = minimum
+    while True:
+        yield delay * random.uniform(1 - jitter, 1 + jitter)
+        delay = min(delay * factor, maximum)
+
+
+def wait_until(
+    ready: Callable[[], bool],
+    paths: Iterable,
+    timeout: float,
+    event_driven: bool = True,
+) -> bool:
+    """Wait until `ready()` is True or `timeout` seconds pass.
+
+    `paths` are the files `ready()` depends on. With `event_driven` the nearest
+    existing directory of each one is watched with inotify and `ready()` is
+    only re-checked when something in them changes. Without inotify, or when
+    `event_driven` is False, `ready()` is polled with jittered backoff.
+
+    With `timeout <= 0`, the default `project_timeout`, this is a single
+    check of `ready()` and sets nothing up. The event-driven wait only takes
+    effect with a positive `project_timeout`.
+    """
+    if timeout <= 0:
+        return ready()
+    deadline = time.monotonic() + timeout
+    if ready():
+        return True
+
+    paths = [str(path) for path in paths]
+    watcher = create_watcher() if event_driven and paths else None
+    delays = backoff_delays()
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+
+            if watcher is not None:
+                for path in paths:
+                    directory = nearest_existing_dir(path)
+                    if directory:
+                        watcher.watch(directory)
+                # a watch added after the file landed would miss it
+                if ready():
+                    return True
+                # cap each wait so a missed event can't stall us for long
+                watcher.wait(min(remaining, MAX_BACKOFF * 5))
+            else:
+                time.sleep(min(next(delays), remaining))
+
+            if ready():
+                return True
+    finally:
+        if watcher is not None:
+            watcher.close()
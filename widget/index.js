@@ -5,6 +5,16 @@ let logIntervals = {};
 let currentSortColumn = "status";
 let currentSortDirection = "desc";
 let completedProjectLogs = new Set();
+// what we already read of each log, by log URL: byte offset, parsed entries
+// and the latest summary from its index
+let logFeeds = {};
+// the activity is published as shards listed in activity/manifest.json, we
+// only fetch the shards the current page and filter need
+const PAGE_SIZE = 25;
+let currentPage = 0;
+let stateFilter = "all";
+let activityManifest = null;
+let loadedShards = {};
 
 // Add this new status emojis mapping
 const statusEmojis = {
@@ -95,11 +105,7 @@ async function fetchProjects() {
     tbody.innerHTML =
       '<tr><td colspan="7"><div class="loading">Loading projects...</div></td></tr>';
 
-    const response = await fetch("./activity.json");
-    if (!response.ok) {
-      throw new Error(`HTTP error! status: ${response.status}`);
-    }
-    const data = await response.json();
+    const data = await loadActivity();
     console.log("Loaded data:", data);
 
     // Check joined projects state
@@ -112,6 +118,129 @@ async function fetchProjects() {
   }
 }
 
+function filteredShards() {
+  return activityManifest.shards.filter(
+    (entry) => stateFilter === "all" || entry.state === stateFilter
+  );
+}
+
+function projectKey(project) {
+  return `${project.state}/${project.author}/${project.name}`;
+}
+
+// Brings a shard we hold up to date from its delta, null if the delta is
+// missing or doesn't start from our version
+async function applyShardDelta(cached, entry) {
+  if (!entry.delta || entry.delta.from !== cached.hash) return null;
+  const response = await fetch(`./activity/${entry.delta.name}`, {
+    cache: "no-store",
+  });
+  if (!response.ok) return null;
+  const delta = await response.json();
+  if (delta.from_hash !== cached.hash || delta.hash !== entry.hash) {
+    return null;
+  }
+
+  const projects = new Map(
+    cached.projects.map((project) => [projectKey(project), project])
+  );
+  delta.removed.forEach((key) => projects.delete(key));
+  delta.upserts.forEach((project) =>
+    projects.set(projectKey(project), project)
+  );
+  return { ...cached, projects: [...projects.values()], hash: delta.hash };
+}
+
+async function fetchShard(entry) {
+  const cached = loadedShards[entry.name];
+  if (cached && cached.hash === entry.hash) {
+    return cached;
+  }
+  if (cached) {
+    const updated = await applyShardDelta(cached, entry).catch(() => null);
+    if (updated) {
+      loadedShards[entry.name] = updated;
+      return updated;
+    }
+  }
+  const response = await fetch(`./activity/${entry.name}`, {
+    cache: "no-store",
+  });
+  if (!response.ok) {
+    throw new Error(`HTTP error! status: ${response.status}`);
+  }
+  const shard = await response.json();
+  loadedShards[entry.name] = shard;
+  return shard;
+}
+
+// Loads the manifest, then shards in order (running, invite, then complete
+// from the newest month) until there are enough projects for the current
+// page, or all of them for a sort other than the default. Shards we already hold are only refetched when their hash changed,
+// through their delta when it starts from the version we hold.
+async function loadActivity() {
+  const response = await fetch("./activity/manifest.json", {
+    cache: "no-store",
+  });
+  if (!response.ok) {
+    throw new Error(`HTTP error! status: ${response.status}`);
+  }
+  activityManifest = await response.json();
+
+  const listed = new Set(activityManifest.shards.map((entry) => entry.name));
+  Object.keys(loadedShards).forEach((name) => {
+    if (!listed.has(name)) delete loadedShards[name];
+  });
+
+  const data = { invite: [], running: [], complete: [] };
+  // shards are loaded in the order of the default sort (status descending:
+  // running, invite, then complete from the newest month), so only that sort
+  // can cut a page from the shards loaded so far. Any other sort needs every
+  // shard, or projects would repeat or go missing between pages
+  const defaultSort =
+    currentSortColumn === "status" && currentSortDirection === "desc";
+  const needed = defaultSort ? (currentPage + 1) * PAGE_SIZE : Infinity;
+  const shardOrder = { running: 0, invite: 1, complete: 2 };
+  const entries = filteredShards().sort(
+    (a, b) => shardOrder[a.state] - shardOrder[b.state]
+  );
+  let loaded = 0;
+  for (const entry of entries) {
+    if (loaded >= needed) break;
+    const shard = await fetchShard(entry);
+    data[shard.state].push(...shard.projects);
+    loaded += shard.projects.length;
+  }
+  return data;
+}
+
+function totalProjects() {
+  return filteredShards().reduce((total, entry) => total + entry.count, 0);
+}
+
+function renderPagination() {
+  const pages = Math.max(Math.ceil(totalProjects() / PAGE_SIZE), 1);
+  const pageInfo = document.getElementById("page-info");
+  if (pageInfo) {
+    pageInfo.textContent = `Page ${currentPage + 1} of ${pages}`;
+  }
+  const prev = document.getElementById("prev-page");
+  const next = document.getElementById("next-page");
+  if (prev) prev.disabled = currentPage === 0;
+  if (next) next.disabled = currentPage >= pages - 1;
+}
+
+function changePage(step) {
+  currentPage = Math.max(currentPage + step, 0);
+  fetchProjects();
+}
+
+function setStateFilter(value) {
+  stateFilter = value;
+  currentPage = 0;
+  fetchProjects();
+}
+
 async function fetchJoinedProjects() {
   const url = `http://localhost:${serverPort}/apps/command/fedreduce`;
   const payload = { command: "list_projects" };
@@ -177,6 +306,40 @@ function formatId(value) {
   return value.replace(/[@\s]/g, "-at-").replace(/[^a-zA-Z0-9-_]/g, "-");
 }
 
+function formatSeconds(seconds) {
+  return seconds < 1
+    ? `${Math.round(seconds * 1000)} ms`
+    : `${seconds.toFixed(2)} s`;
+}
+
+// The chain of steps that decided when the project finished, and where its
+// time went
+function renderCriticalPath(criticalPath) {
+  if (!criticalPath) {
+    return "";
+  }
+  const phases = Object.entries(criticalPath.breakdown)
+    .map(
+      ([phase, seconds]) =>
+        `<li><span class="phase-name">${phase}</span> ${formatSeconds(
+          seconds
+        )}</li>`
+    )
+    .join("");
+  const steps = criticalPath.steps
+    .map(
+      (step) =>
+        `${escapeHtml(String(step.step))} (${escapeHtml(step.datasite)})`
+    )
+    .join(" → ");
+  return `
+    <div class="detail-section">
+      <h3>⏱️ Critical Path ${formatSeconds(criticalPath.seconds)}</h3>
+      <ul class="critical-path-phases">${phases}</ul>
+      <p class="critical-path-steps">${steps}</p>
+    </div>`;
+}
+
 function getActionButtons(project, isJoined, isAuthor) {
   const buttons = [];
 
@@ -340,9 +503,14 @@ function renderProjects(data, joinedProjects) {
     ...data.complete.map((p) => ({ ...p, status: "complete" })),
   ];
 
-  const sortedProjects = sortProjects(allProjects);
+  // loadActivity loaded every shard unless this is the default sort
+  const sortedProjects = sortProjects(allProjects).slice(
+    currentPage * PAGE_SIZE,
+    (currentPage + 1) * PAGE_SIZE
+  );
   const tbody = document.getElementById("projects-tbody");
   tbody.innerHTML = "";
+  renderPagination();
 
   sortedProjects.forEach((project) => {
     const isJoined = joinedProjects.some(
@@ -433,6 +601,7 @@ function renderProjects(data, joinedProjects) {
                 </div>
               </div>
             </div>
+            ${renderCriticalPath(project.criticalPath)}
           </div>
 
           ${
@@ -458,14 +627,17 @@ function renderProjects(data, joinedProjects) {
                       <a 
                         href="/datasites/${datasite}/fedreduce/${
                       project.status
-                    }/${project.author}/${project.name}.yaml.log" 
+                    }/${project.author}/${project.name}.yaml.log.index.json" 
                         class="log-file-link" 
                         target="_blank"
-                        title="View raw log file"
+                        title="View the log's segment index"
                         onclick="event.stopPropagation();"
                       >
                         📄
                       </a>
+                      <span class="log-summary" id="${formatId(
+                        datasite
+                      )}-summary-${projectId}"></span>
                     </div>
                   `
                   )
@@ -609,68 +781,105 @@ async function fetchLogContent(
   sharedLogId
 ) {
   try {
-    const response = await fetch(logUrl);
-    if (response.ok) {
-      const text = await response.text();
-      const lines = text.trim().split("\n");
-      let individualLogs = [];
-
-      lines.forEach((line) => {
-        try {
-          const logEntry = JSON.parse(line);
-          const formattedLine = `[${logEntry.timestamp}] ${datasite}: ${logEntry.message}`;
-
-          individualLogs.push({
-            timestamp: new Date(logEntry.timestamp).getTime(),
-            line: formattedLine,
+    // the index is small: it tells us whether there is anything new at all
+    const response = await fetch(`${logUrl}.index.json`, { cache: "no-store" });
+    if (!response.ok) {
+      console.error("Failed to fetch log index:", logId);
+      return;
+    }
+    const index = await response.json();
+
+    const feed = (logFeeds[logUrl] ??= { offset: 0, entries: [] });
+    feed.summary = index.summary || {};
+    const newEntries = [];
+    if (index.size > feed.offset) {
+      const baseUrl = logUrl.slice(0, logUrl.lastIndexOf("/") + 1);
+      for (const segment of index.segments) {
+        const end = segment.offset + segment.length;
+        if (end <= feed.offset) continue;
+
+        // only ask for the bytes past what we have, up to the length the
+        // index recorded, so a poll costs the new lines and not the segment
+        const start = Math.max(feed.offset - segment.offset, 0);
+        const segmentResponse = await fetch(baseUrl + segment.name, {
+          cache: "no-store",
+          headers: { Range: `bytes=${start}-${segment.length - 1}` },
+        });
+        if (!segmentResponse.ok) break;
+        let bytes = new Uint8Array(await segmentResponse.arrayBuffer());
+        // a server without range support sends the whole segment
+        if (segmentResponse.status !== 206) bytes = bytes.subarray(start);
+        // only whole lines are consumed
+        const lastNewline = bytes.lastIndexOf(10);
+        if (lastNewline < 0) break;
+        const text = new TextDecoder().decode(
+          bytes.subarray(0, lastNewline + 1)
+        );
+
+        text
+          .trim()
+          .split("\n")
+          .forEach((line) => {
+            try {
+              const logEntry = JSON.parse(line);
+              newEntries.push({
+                timestamp: new Date(logEntry.timestamp).getTime(),
+                line: `[${logEntry.timestamp}] ${datasite}: ${logEntry.message}`,
+              });
+            } catch (error) {
+              console.error("Failed to parse JSON log line:", line, error);
+            }
           });
+        feed.offset = segment.offset + start + lastNewline + 1;
+        if (start + lastNewline + 1 < segment.length) break;
+      }
+      feed.entries.push(...newEntries);
+    }
 
-          // Only add to shared log content if not already present
-          if (!sharedLogContent.some((entry) => entry.line === formattedLine)) {
-            sharedLogContent.push({
-              timestamp: new Date(logEntry.timestamp).getTime(),
-              line: formattedLine,
-            });
-          }
-        } catch (error) {
-          console.error("Failed to parse JSON log line:", line, error);
-        }
-      });
+    // a fresh shared view (after a re-render) needs everything read so far
+    if (feed.shared !== sharedLogContent) {
+      feed.shared = sharedLogContent;
+      sharedLogContent.push(...feed.entries);
+    } else {
+      sharedLogContent.push(...newEntries);
+    }
+    sharedLogContent.sort((a, b) => a.timestamp - b.timestamp);
 
-      // Sort logs by timestamp
-      individualLogs.sort((a, b) => a.timestamp - b.timestamp);
-      sharedLogContent.sort((a, b) => a.timestamp - b.timestamp);
+    const summaryElement = document.getElementById(
+      logId.replace("-log-", "-summary-")
+    );
+    if (summaryElement) {
+      const { last_step, last_error, errors } = feed.summary;
+      summaryElement.textContent =
+        last_step !== undefined ? `step ${last_step}` : "";
+      summaryElement.title = last_error
+        ? `${errors} error(s), last: ${last_error}`
+        : "";
+      summaryElement.classList.toggle("has-error", Boolean(last_error));
+    }
 
-      // Update individual datasite log
-      const individualLogViewer = document.getElementById(logId);
-      if (individualLogViewer) {
-        individualLogViewer.textContent = individualLogs
-          .map((entry) => entry.line)
-          .join("\n");
-      }
+    // Update individual datasite log
+    const individualLogViewer = document.getElementById(logId);
+    if (individualLogViewer) {
+      individualLogViewer.textContent = feed.entries
+        .map((entry) => entry.line)
+        .join("\n");
+    }
 
-      // Update shared log
-      const sharedLogViewer = document.getElementById(sharedLogId);
-      if (sharedLogViewer) {
-        sharedLogViewer.textContent = sharedLogContent
-          .map((entry) => entry.line)
-          .join("\n");
-
-        // Auto-scroll to bottom only for running projects
-        const projectStatus = sharedLogId
-          .closest(".project-details")
-          ?.querySelector(".status-badge")?.textContent;
-        if (projectStatus?.includes("Running")) {
-          if (
-            sharedLogViewer.scrollTop + sharedLogViewer.clientHeight ===
-            sharedLogViewer.scrollHeight
-          ) {
-            sharedLogViewer.scrollTop = sharedLogViewer.scrollHeight;
-          }
-        }
+    // Update shared log
+    const sharedLogViewer = document.getElementById(sharedLogId);
+    if (sharedLogViewer) {
+      const atBottom =
+        sharedLogViewer.scrollTop + sharedLogViewer.clientHeight ===
+        sharedLogViewer.scrollHeight;
+      sharedLogViewer.textContent = sharedLogContent
+        .map((entry) => entry.line)
+        .join("\n");
+
+      // Auto-scroll to bottom only for running projects
+      if (logUrl.includes("/running/") && atBottom) {
+        sharedLogViewer.scrollTop = sharedLogViewer.scrollHeight;
       }
-    } else {
-      console.error("Failed to fetch log:", logId);
     }
   } catch (error) {
     console.error("Error fetching log:", error);
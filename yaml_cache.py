@@ -0,0 +1,93 @@
+import os
+import pickle
+from typing import Any, Optional
+
+DEFAULT_CACHE_FILE = "./yaml_cache.pickle"
+
+
+def parse_yaml(file_path) -> Any:
+    # imported here so ticks that hit the cache never load PyYAML
+    import yaml
+
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    with open(file_path, "r") as file:
+        return yaml.load(file, Loader=loader)
+
+
+class YamlCache:
+    """Parsed YAML documents keyed by (path, size, mtime_ns).
+
+    The cache is pickled to disk so it survives between app ticks and is shared
+    by app.py, run.py and command.py. Documents are returned as-is, so callers
+    must treat them as read-only and copy before modifying.
+    """
+
+    def __init__(self, filename=DEFAULT_CACHE_FILE):
+        self.filename = filename
+        self.entries = {}
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.filename):
+            return
+        try:
+            with open(self.filename, "rb") as file:
+                self.entries = pickle.load(file)
+        except Exception:
+            self.entries = {}
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp_path = f"{self.filename}.tmp"
+        with open(tmp_path, "wb") as file:
+            pickle.dump(self.entries, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.filename)
+        self.dirty = False
+
+    def load(self, file_path) -> Any:
+        """Return the parsed document, parsing only if the file changed."""
+        key = os.path.abspath(file_path)
+        stat = os.stat(key)
+        cached = self.entries.get(key)
+        if (
+            cached is not None
+            and cached["size"] == stat.st_size
+            and cached["mtime_ns"] == stat.st_mtime_ns
+        ):
+            self.hits += 1
+            return cached["doc"]
+
+        self.misses += 1
+        doc = parse_yaml(key)
+        self.entries[key] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "doc": doc,
+        }
+        self.dirty = True
+        return doc
+
+    def prune(self):
+        """Drop entries for files that no longer exist."""
+        for key in [key for key in self.entries if not os.path.exists(key)]:
+            del self.entries[key]
+            self.dirty = True
+
+
+_yaml_cache: Optional[YamlCache] = None
+
+
+def get_yaml_cache() -> YamlCache:
+    """Process-wide cache instance shared by every module."""
+    global _yaml_cache
+    if _yaml_cache is None:
+        _yaml_cache = YamlCache()
+    return _yaml_cache
+
+
+def load_yaml(file_path) -> Any:
+    return get_yaml_cache().load(file_path)